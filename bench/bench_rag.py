@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Query latency microbenchmark for local_rag retrieval.
+
+    python bench/bench_rag.py --sizes 10000 100000 --queries 200
+    python bench/bench_rag.py --backends keyword vector --batch 64
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from local_rag import create_rag
+
+SKILL_WORDS = """
+python java javascript typescript go rust sql nosql postgres mysql mongodb redis kafka spark hadoop airflow
+pandas numpy scikit tensorflow pytorch keras statistics regression classification clustering nlp vision
+react angular vue css html frontend backend api rest graphql microservices fastapi django flask spring
+docker kubernetes terraform aws azure gcp cloud devops ci cd linux bash monitoring security networking
+agile scrum leadership management mentoring communication product design ux testing automation data
+analysis reporting business intelligence dashboards tableau excel machine learning deep science engineering
+""".split()
+FILLER_WORDS = "experience with using for and in of built designed led delivered years team projects".split()
+
+
+def synthetic_documents(n: int, seed: int = 7):
+    """CV-fragment-like documents over a fixed skill vocabulary plus rare terms"""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        skills = rng.sample(SKILL_WORDS, 6)
+        words = skills + rng.sample(FILLER_WORDS, 5) + [f"project{rng.randrange(n)}"]
+        rng.shuffle(words)
+        docs.append({"id": f"doc{i}", "content": " ".join(words), "keywords": skills[:3]})
+    return docs
+
+
+def synthetic_queries(n: int, seed: int = 11):
+    rng = random.Random(seed)
+    return [f"How can I improve my {' and '.join(rng.sample(SKILL_WORDS, rng.randint(1, 4)))} skills?" for _ in range(n)]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench(rag, queries, n_results):
+    rag.search(queries[0], n_results)  # build lazily-computed stats outside the timing
+    latencies = []
+    for q in queries:
+        started = time.perf_counter()
+        rag.search(q, n_results)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "qps": round(1000 / statistics.fmean(latencies), 1),
+    }
+
+
+def bench_batch(rag, queries, n_results, batch_size):
+    started = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        rag.search_batch(queries[i:i + batch_size], n_results)
+    elapsed = time.perf_counter() - started
+    return {"batch_size": batch_size, "batch_mean_ms_per_query": round(elapsed * 1000 / len(queries), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=["keyword"], choices=["keyword", "vector"])
+    parser.add_argument("--batch", type=int, default=0, help="also time search_batch() with this batch size")
+    args = parser.parse_args()
+
+    queries = synthetic_queries(args.queries)
+    for size in args.sizes:
+        docs = synthetic_documents(size)
+        for backend in args.backends:
+            started = time.perf_counter()
+            rag = create_rag(backend, docs)
+            build_s = time.perf_counter() - started
+            result = {"backend": backend, "documents": size, "build_s": round(build_s, 3), **bench(rag, queries, args.top_k)}
+            if args.batch:
+                result.update(bench_batch(rag, queries, args.top_k, args.batch))
+            print(json.dumps(result))
+            del rag
+
+
+if __name__ == "__main__":
+    main()
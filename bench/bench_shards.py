@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Throughput of sharded retrieval (rag_shards.py) by number of worker processes.
+
+    python bench/bench_shards.py --documents 400000 --workers 1 2 4 8
+    python bench/bench_shards.py --backend vector --concurrency 16
+
+Builds a synthetic index with one segment per shard for the largest worker
+count, then runs the same queries from --concurrency client threads against
+an unsharded MmapRAG and a ShardedRAG per worker count. Results are checked
+against the unsharded index. Scaling is bounded by os.cpu_count().
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from bench_rag import percentile, synthetic_documents, synthetic_queries
+from rag_index import MmapRAG, build_index
+from rag_shards import ShardedRAG
+
+
+def run(rag, queries, n_results, concurrency):
+    def timed(q):
+        started = time.perf_counter()
+        hits = rag.search(q, n_results)
+        return (time.perf_counter() - started) * 1000, [doc["id"] for score, doc in hits]
+
+    rag.search(queries[0], n_results)  # warm caches and workers outside the timing
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(timed, queries))
+    elapsed = time.perf_counter() - started
+    latencies = [ms for ms, ids in results]
+    stats = {
+        "qps": round(len(queries) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+    }
+    return stats, [ids for ms, ids in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--backend", default="keyword", choices=["keyword", "vector"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads issuing queries")
+    args = parser.parse_args()
+
+    queries = synthetic_queries(args.queries)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "docs.jsonl")
+        with open(source, "w", encoding="utf-8") as f:
+            for doc in synthetic_documents(args.documents):
+                f.write(json.dumps(doc) + "\n")
+        index_dir = os.path.join(tmp, "index")
+        started = time.perf_counter()
+        manifest = build_index(source, index_dir, dim=None if args.backend == "vector" else 0,
+                               segment_docs=math.ceil(args.documents / max(args.workers)))
+        header = {"backend": args.backend, "documents": args.documents, "segments": len(manifest["segments"]),
+                  "build_s": round(time.perf_counter() - started, 3), "cpu_count": os.cpu_count()}
+        print(json.dumps(header))
+
+        baseline, expected = run(MmapRAG(index_dir, backend=args.backend), queries, args.top_k, args.concurrency)
+        print(json.dumps({"workers": 0, "sharded": False, **baseline}))
+        for workers in args.workers:
+            rag = ShardedRAG(index_dir, backend=args.backend, workers=workers)
+            try:
+                rag.warm_up()
+                stats, ids = run(rag, queries, args.top_k, args.concurrency)
+            finally:
+                rag.close()
+            print(json.dumps({"workers": workers, "shards": len(rag.shards), **stats,
+                              "speedup": round(stats["qps"] / baseline["qps"], 2),
+                              "matches_unsharded": ids == expected}))
+
+
+if __name__ == "__main__":
+    main()
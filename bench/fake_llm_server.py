@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Groq API (OpenAI-compatible chat completions).
+
+    python bench/fake_llm_server.py --port 9100 --latency 0.3 --jitter 0.1
+    GROQ_BASE_URL=http://127.0.0.1:9100 python client/client_agent.py
+"""
+import os
+import time
+import random
+import asyncio
+import json
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.05"))
+
+app = FastAPI()
+stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def _fake_answer(messages) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    if "Refined Intent" in prompt:
+        question = prompt.split('Original Query: "', 1)[-1].split('"', 1)[0]
+        return f"Identify skills and learning resources for: {question}"
+    return (
+        "Based on your current skills, focus on one target role, close the gaps with a short "
+        "course from the listed resources, and build a small portfolio project to show it."
+    )
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+async def _stream(completion_id: str, model: str, content: str, latency: float):
+    # Time-to-first-token is a fraction of the latency, the rest is spread over tokens
+    words = content.split(" ")
+    await asyncio.sleep(latency * 0.3)
+    yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+    for i, word in enumerate(words):
+        await asyncio.sleep(latency * 0.7 / len(words))
+        yield _chunk(completion_id, model, {"content": word if i == 0 else " " + word})
+    yield _chunk(completion_id, model, {}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    completion_id = f"chatcmpl-fake-{stats['requests']}"
+    latency = max(0.0, random.gauss(LATENCY, JITTER))
+    content = _fake_answer(body.get("messages", []))
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream(completion_id, body.get("model", "fake"), content, latency),
+            media_type="text/event-stream",
+        )
+
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(latency)
+    finally:
+        stats["in_flight"] -= 1
+    words = len(content.split())
+    return JSONResponse(content={
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": words, "total_tokens": words},
+    })
+
+
+@app.get("/stats")
+async def get_stats():
+    return JSONResponse(content=stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=LATENCY, help="mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=JITTER, help="stddev seconds per completion")
+    args = parser.parse_args()
+    LATENCY, JITTER = args.latency, args.jitter
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""End-to-end load benchmark for /api/agtchat with local Groq and DuckDuckGo stand-ins.
+
+    python bench/load_test.py --concurrency 16 --requests 400 --output results.json
+    python bench/load_test.py --llm-latency 0.4 --search-latency 1.0 --unique 0.5
+    python bench/load_test.py --app-url http://localhost:7081   # drive an app you started
+
+Unless --app-url is given, this starts bench/fake_llm_server.py and the
+FastAPI app from client/client_agent.py. The app points GROQ_BASE_URL at
+the fake server and puts bench/stubs on PYTHONPATH, so its MCP search
+servers use a fake DDGS. Per-stage times come from the app's
+Server-Timing header. The report is JSON on stdout and in --output.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+
+DEFAULT_MIX = [
+    {"question": "What programming skills do I have?", "weight": 1},
+    {"question": "How can I become a data scientist?", "weight": 1},
+    {"question": "What cloud computing skills should I learn?", "weight": 1},
+    {"question": "How do I improve my machine learning expertise?", "weight": 1},
+]
+
+
+# ------------------ Processes ------------------
+def _spawn(args: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def _wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url, timeout=2)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+def start_stack(args) -> List[subprocess.Popen]:
+    """Fake LLM server plus the app wired to the fakes"""
+    env = dict(os.environ)
+    # Each run starts with an empty search result cache
+    search_cache_path = os.path.join(args.log_dir, "search_cache.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(search_cache_path + suffix):
+            os.remove(search_cache_path + suffix)
+    llm = _spawn(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_llm_server.py"), "--port", str(args.llm_port),
+         "--latency", str(args.llm_latency), "--jitter", str(args.llm_jitter)],
+        env, os.path.join(args.log_dir, "fake_llm.log"),
+    )
+    env.update({
+        "GROQ_BASE_URL": f"http://127.0.0.1:{args.llm_port}",
+        "GROQ_API_KEY": "bench",
+        "PYTHONPATH": os.pathsep.join(filter(None, [os.path.join(BENCH_DIR, "stubs"), env.get("PYTHONPATH")])),
+        "FAKE_SEARCH_LATENCY": str(args.search_latency),
+        "FAKE_SEARCH_JITTER": str(args.search_jitter),
+        "FAKE_SEARCH_SLOW_RATE": str(args.search_slow_rate),
+        "FAKE_SEARCH_SLOW_LATENCY": str(args.search_slow_latency),
+        "MCP_POOL_SIZE": str(args.pool_size),
+        "GROQ_RPM": str(args.rpm),
+        "GROQ_TPM": str(args.tpm),
+        "DDG_CACHE_PATH": search_cache_path,
+        "DDG_CACHE_TTL": str(args.search_cache_ttl),
+        "ADMISSION_MAX_INFLIGHT": str(args.max_inflight),
+        "ADMISSION_MAX_QUEUE": str(args.max_queue),
+        "ADMISSION_QUEUE_TIMEOUT": str(args.queue_timeout),
+    })
+    app = _spawn(
+        [sys.executable, "-m", "uvicorn", "client_agent:app", "--app-dir", "client",
+         "--port", str(args.port), "--log-level", "warning"],
+        env, os.path.join(args.log_dir, "app.log"),
+    )
+    return [llm, app]
+
+
+def stop_stack(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ------------------ Load ------------------
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """{"refine": ms, ...} from a Server-Timing header"""
+    timings = {}
+    for metric in (header or "").split(","):
+        parts = [p.strip() for p in metric.split(";")]
+        for part in parts[1:]:
+            if part.startswith("dur="):
+                timings[parts[0]] = float(part[4:])
+    return timings
+
+
+def build_requests(mix: List[Dict], n: int, unique: float, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    questions = rng.choices([m["question"] for m in mix], weights=[m.get("weight", 1) for m in mix], k=n)
+    # A unique suffix defeats the answer and stage caches for that request
+    return [f"{q} (variant {i})" if rng.random() < unique else q for i, q in enumerate(questions)]
+
+
+async def run_load(base_url: str, questions: List[str], concurrency: int, timeout: float) -> Dict:
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, question in enumerate(questions):
+        queue.put_nowait((i, question))
+    samples = []
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            try:
+                i, question = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            sample = {"question": question}
+            try:
+                response = await client.post(
+                    f"{base_url}/api/agtchat",
+                    json={"Question": question, "conversation_id": f"bench-{i}"},
+                    timeout=timeout,
+                )
+                sample["status"] = response.status_code
+                body = response.json()
+                sample["ok"] = response.status_code == 200 and not \
+                    body.get("answer", "").startswith("Error processing request")
+                sample["skipped"] = body.get("skipped_stages", [])
+                sample["stages"] = parse_server_timing(response.headers.get("server-timing"))
+            except (httpx.HTTPError, ValueError) as e:
+                sample.update(status=0, ok=False, error=str(e), stages={})
+            sample["latency_ms"] = (time.perf_counter() - started) * 1000
+            samples.append(sample)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+    return {"samples": samples, "duration_s": duration}
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 2)
+
+    return {"count": len(values), "mean": round(statistics.fmean(values), 2),
+            "p50": pct(50), "p95": pct(95), "p99": pct(99), "max": round(ordered[-1], 2)}
+
+
+def report(args, load: Dict, extra: Dict) -> Dict:
+    samples = load["samples"]
+    ok = [s for s in samples if s["ok"]]
+    stages: Dict[str, List[float]] = {}
+    for sample in ok:
+        for stage, ms in sample["stages"].items():
+            stages.setdefault(stage, []).append(ms)
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "log_dir")},
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        # Answered without some stage (it overran its budget), see skipped_stages
+        "degraded": sum(1 for s in ok if s.get("skipped")),
+        # Rejected by admission control (429 on arrival, 503 after queueing)
+        "shed": {str(status): sum(1 for s in samples if s["status"] == status) for status in (429, 503)},
+        "duration_s": round(load["duration_s"], 3),
+        "rps": round(len(samples) / load["duration_s"], 2) if load["duration_s"] else 0.0,
+        "latency_ms": summarize([s["latency_ms"] for s in ok]),
+        "stages_ms": {stage: summarize(values) for stage, values in sorted(stages.items())},
+        **extra,
+    }
+
+
+async def main_async(args) -> Dict:
+    processes = []
+    base_url = args.app_url
+    if not base_url:
+        os.makedirs(args.log_dir, exist_ok=True)
+        processes = start_stack(args)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        await _wait_ready(f"{base_url}/api/mcp/pool")
+        mix = DEFAULT_MIX
+        if args.mix:
+            with open(args.mix, encoding="utf-8") as f:
+                mix = json.load(f)
+        if args.warmup:
+            await run_load(base_url, build_requests(mix, args.warmup, 1.0, args.seed + 1), args.concurrency, args.timeout)
+        questions = build_requests(mix, args.requests, args.unique, args.seed)
+        load = await run_load(base_url, questions, args.concurrency, args.timeout)
+
+        extra = {}
+        async with httpx.AsyncClient() as client:
+            for name, path in (("pool", "/api/mcp/pool"), ("cache", "/api/cache/stats"),
+                               ("admission", "/api/admission/stats")):
+                try:
+                    extra[name] = (await client.get(f"{base_url}{path}", timeout=5)).json()
+                except (httpx.HTTPError, ValueError):
+                    pass
+        return report(args, load, extra)
+    finally:
+        stop_stack(processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=0, help="uncached requests sent before measuring")
+    parser.add_argument("--mix", help='JSON file: [{"question": ..., "weight": ...}, ...]')
+    parser.add_argument("--unique", type=float, default=0.0, help="fraction of requests made unique (cache misses)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--app-url", help="benchmark an already running app instead of starting one")
+    parser.add_argument("--port", type=int, default=7090)
+    parser.add_argument("--llm-port", type=int, default=9100)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    parser.add_argument("--search-jitter", type=float, default=0.1)
+    parser.add_argument("--search-slow-rate", type=float, default=0.0, help="share of searches that stall")
+    parser.add_argument("--search-slow-latency", type=float, default=10.0)
+    parser.add_argument("--search-cache-ttl", type=float, default=0,
+                        help="search servers' disk cache TTL in seconds (0 = off)")
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--max-inflight", type=int, default=32, help="app's admission limit (0 = off)")
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--queue-timeout", type=float, default=5.0)
+    parser.add_argument("--rpm", type=float, default=0, help="client-side LLM requests/min limit (0 = off)")
+    parser.add_argument("--tpm", type=float, default=0, help="client-side LLM tokens/min limit (0 = off)")
+    parser.add_argument("--log-dir", default=os.path.join(BENCH_DIR, "logs"))
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
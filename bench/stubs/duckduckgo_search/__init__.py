@@ -0,0 +1,36 @@
+"""Local stand-in for duckduckgo_search, used by bench/load_test.py.
+
+Put bench/stubs first on PYTHONPATH and the search MCP servers import this
+DDGS instead of the real one. Latency is a blocking sleep, like the real
+client's HTTP call, drawn from FAKE_SEARCH_LATENCY / FAKE_SEARCH_JITTER.
+A FAKE_SEARCH_SLOW_RATE share of searches take FAKE_SEARCH_SLOW_LATENCY
+instead, to reproduce DuckDuckGo's occasional stalls.
+"""
+import os
+import time
+import random
+
+LATENCY = float(os.getenv("FAKE_SEARCH_LATENCY", "0.5"))
+JITTER = float(os.getenv("FAKE_SEARCH_JITTER", "0.1"))
+SLOW_RATE = float(os.getenv("FAKE_SEARCH_SLOW_RATE", "0"))
+SLOW_LATENCY = float(os.getenv("FAKE_SEARCH_SLOW_LATENCY", "10"))
+
+
+class DDGS:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def text(self, keywords, max_results=5, **kwargs):
+        if random.random() < SLOW_RATE:
+            time.sleep(SLOW_LATENCY)
+        else:
+            time.sleep(max(0.0, random.gauss(LATENCY, JITTER)))
+        topic = keywords.replace(" skills training courses resources", "")
+        return [
+            {
+                "title": f"{topic} course {i + 1}",
+                "href": f"https://example.com/courses/{i + 1}",
+                "body": f"A hands-on course covering {topic}.",
+            }
+            for i in range(max_results or 3)
+        ]
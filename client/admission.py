@@ -0,0 +1,147 @@
+import os
+import math
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+from telemetry import get_logger, counter
+
+logger = get_logger("admission")
+
+# Requests running the agent at once (0 disables admission control)
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "32"))
+# Requests waiting for a slot; arrivals beyond this are shed at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Longest a request may wait for a slot before it is shed
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+
+SHED = counter("agent_admission_shed_total", "Requests rejected by admission control")
+
+
+class Overloaded(Exception):
+    """A request shed by admission control; `status` is 429 or 503"""
+
+    def __init__(self, message: str, status: int, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded FIFO queue and a queueing deadline.
+
+    Up to `max_inflight` requests run at once and up to `max_queue` wait
+    for a slot, each at most `queue_timeout` seconds. A finished request
+    hands its slot straight to the oldest waiter. Requests are shed:
+
+    - with 429 on arrival when the queue is full or the wait predicted
+      from recent service times exceeds `queue_timeout`, so clients back
+      off before they wait only to fail;
+    - with 503 when they waited `queue_timeout` without getting a slot.
+
+    Retry-After is the predicted time for the current queue to drain.
+    """
+
+    def __init__(self, max_inflight: int = ADMISSION_MAX_INFLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_time: Optional[float] = None  # EWMA of seconds a slot is held
+        self.counters = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_predicted_wait": 0,
+                         "shed_queue_timeout": 0, "wait_ms_total": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_inflight > 0
+
+    def predicted_wait(self, position: int) -> float:
+        """Seconds until the request at queue `position` (1 = next) gets a slot"""
+        if self._service_time is None:
+            return 0.0
+        return self._service_time * math.ceil(position / self.max_inflight)
+
+    def _shed(self, reason: str, status: int, message: str):
+        self.counters[f"shed_{reason}"] += 1
+        SHED.inc(reason=reason)
+        retry_after = self.predicted_wait(len(self._waiters) + 1) or self.queue_timeout
+        raise Overloaded(message, status, max(1.0, retry_after))
+
+    async def acquire(self):
+        """Wait for a slot or raise Overloaded"""
+        if not self.enabled:
+            return
+        if self.inflight < self.max_inflight and not self._waiters:
+            self.inflight += 1
+            self.counters["admitted"] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._shed("queue_full", 429, f"Server busy: {len(self._waiters)} requests already waiting")
+        predicted = self.predicted_wait(len(self._waiters) + 1)
+        if predicted > self.queue_timeout:
+            self._shed("predicted_wait", 429, f"Server busy: predicted wait {predicted:.1f}s")
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self.counters["queued"] += 1
+        started = loop.time()
+        try:
+            # release() hands the slot over by resolving the future; inflight stays counted
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._shed("queue_timeout", 503, f"Server busy: no capacity within {self.queue_timeout:.0f}s")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot arrived as the client went away
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self.counters["wait_ms_total"] += (loop.time() - started) * 1000
+        self.counters["admitted"] += 1
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
+
+    def _observe(self, seconds: float):
+        self._service_time = seconds if self._service_time is None else 0.8 * self._service_time + 0.2 * seconds
+
+    @asynccontextmanager
+    async def slot(self, observe: bool = True):
+        """Hold a slot for the body; `observe=False` keeps its duration out of the wait prediction"""
+        await self.acquire()
+        if not self.enabled:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            yield
+        finally:
+            if observe:
+                self._observe(loop.time() - started)
+            self.release()
+
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def stats(self) -> dict:
+        queued = self.counters["queued"]
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "inflight": self.inflight,
+            "queued_now": self.queued(),
+            **{k: v for k, v in self.counters.items() if k != "wait_ms_total"},
+            "avg_queue_wait_ms": round(self.counters["wait_ms_total"] / queued, 3) if queued else 0.0,
+            "service_time_ms": round((self._service_time or 0.0) * 1000, 1),
+        }
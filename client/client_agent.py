@@ -5,242 +5,589 @@ import httpx
 import sys
 import os
 import uvicorn
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 import asyncio
+import json
+import hashlib
+import math
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import List
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from groq import Groq
-from client import clientagt_cache
+from client import clientagt_cache, conversation_memory, llm_scheduler, query_refiner
 # from semantic_kernel.functions import kernel_function  # Not needed in simplified version
 from dotenv import load_dotenv
 load_dotenv()
+from client.llm_client import get_llm_client, close_llm_client
+from client.query_refiner import REFINER_MODE, LocalRefiner, create_refiner
+from client.llm_scheduler import LLMRateLimited, PRIORITY_BATCH, PROMPT_TOKEN_BUDGET, count_tokens, fit_to_budget, llm_deadline, llm_priority
+import telemetry
+from telemetry import get_logger, span
 
+logger = get_logger("client_agent")
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_MODEL = "llama-3.1-8b-instant"  # Updated free model
-
-
-
-# ------------------ Groq Client ------------------
-def get_groq_client():
-    return Groq(api_key=GROQ_API_KEY)
-
-
-# ------------------ Refiner Plugin ------------------
-class QueryRefinerPlugin:
-    def __init__(self):
-        self.client = get_groq_client()
-        self.model = GROQ_MODEL
-
-    async def refine_query(self, query: str) -> str:
-        try:
-            prompt = f"""
-            You are a smart assistant that refines casual or vague user queries into clear, structured intent statements.
-            Rephrase the input for clarity and remove filler words.
-
-            Original Query: "{query.strip()}"
-            Refined Intent:"""
-
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a query refiner that restructures raw user questions into clean, intent-focused queries."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                max_tokens=60
-            )
-
-            refined_query = response.choices[0].message.content.strip()
-            print(f"\n[QueryRefinerPlugin] Refined: {refined_query}")
-            return refined_query
-
-        except Exception as e:
-            fallback = f"Refined intent from user: {query.strip().capitalize()}."
-            print(f"[QueryRefinerPlugin] ⚠️ Fallback due to error: {e}")
-            return fallback
-        
 
 # MCP Client Integration
-import subprocess
-import json
-import asyncio
-from mcp.client.session import ClientSession
-from mcp.client.stdio import stdio_client
+from client.mcp_pool import MCPSessionPool, MCP_POOL_SIZE
+from client.stage_graph import StageGraph, StageTimeout
+from client.admission import AdmissionController, Overloaded
+from client.hedging import Hedge
+from client.singleflight import SingleFlight
+
+# ------------------ MCP Session Pool ------------------
+# Warm, long-lived server processes (or network connections, see
+# MCP_<NAME>_TRANSPORT) shared by every request. Started and stopped with
+# the FastAPI app lifespan (or lazily on first use).
+mcp_pool = MCPSessionPool(size=MCP_POOL_SIZE)
+mcp_pool.register("skills", "mcp/rag_mcp_stdio.py")
+mcp_pool.register("search", "mcp/search_mcp_stdio.py")
 
 # ------------------ MCP Client Functions ------------------
+def tool_text(result, empty):
+    """Text of a tool result; a result flagged isError raises so it is never cached"""
+    text = result.content[0].text if result.content else empty
+    if result.isError:
+        raise RuntimeError(text)
+    return text
+
+def note_own_index(conversation_id, result):
+    """Remember a conversation the skills server answered from its own CV index (_meta tenant_index)"""
+    if conversation_id and (result.meta or {}).get("tenant_index"):
+        clientagt_cache.set_own_index(conversation_id)
+
 class MCPSkillsClient:
     """MCP client for skills analysis server"""
 
+    def __init__(self, pool: MCPSessionPool = mcp_pool):
+        self.pool = pool
+
     async def get_skills(self, user_input: str, conversation_id: str) -> str:
         """Call the RAG MCP server for skills analysis"""
         try:
-            print(f"🔍 [MCP] Starting RAG server process...")
-
-            # Start the RAG MCP server process
-            server_process = await asyncio.create_subprocess_exec(
-                "python", "mcp/rag_mcp_stdio.py",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                stdin=asyncio.subprocess.PIPE,
-                cwd="/Users/youness/Desktop/MCP_Project"
-            )
-
-            print(f"✅ [MCP] RAG server process started with PID {server_process.pid}")
-
-            # Create MCP client session
-            print(f"🔗 [MCP] Creating stdio client...")
-            async with stdio_client(server_process.stdout, server_process.stdin) as (read_stream, write_stream):
-                print(f"🔗 [MCP] Created stdio streams")
-
-                async with ClientSession(read_stream, write_stream) as session:
-                    print(f"🚀 [MCP] Initializing session...")
-                    # Initialize the session
-                    await session.initialize()
-                    print(f"✅ [MCP] Session initialized successfully")
-
-                    print(f"📞 [MCP] Calling get_skills tool with: {user_input}")
-                    # Call the get_skills tool
-                    result = await session.call_tool(
-                        "get_skills",
-                        arguments={
-                            "user_input": user_input,
-                            "conversation_id": conversation_id
-                        }
-                    )
-                    print(f"✅ [MCP] Tool call completed successfully")
-
-                    # Cleanup
-                    server_process.terminate()
-                    await server_process.wait()
-                    print(f"🧹 [MCP] Server process cleaned up")
-
-                    return result.content[0].text if result.content else "No skills found"
+            with span("mcp.call_tool", tool="get_skills"):
+                result = await self.pool.call_tool(
+                    "skills", "get_skills",
+                    arguments={
+                        "user_input": user_input,
+                        "conversation_id": conversation_id
+                    }
+                )
+            telemetry.record_spans((result.meta or {}).get("spans"))
+            note_own_index(conversation_id, result)
+            return tool_text(result, "No skills found")
 
         except Exception as e:
-            print(f"❌ [MCP Skills Error] {str(e)}")
+            logger.warning("[MCP Skills Error] %s", e)
             return f"[MCP Skills Error] {str(e)}"
 
+    async def get_skills_batch(self, queries: List[str], conversation_id: str = None) -> List[str]:
+        """Skills for several queries in one tool call, in query order"""
+        try:
+            with span("mcp.call_tool", tool="get_skills_batch"):
+                result = await self.pool.call_tool(
+                    "skills", "get_skills_batch",
+                    arguments={"queries": queries, "conversation_id": conversation_id}
+                )
+            telemetry.record_spans((result.meta or {}).get("spans"))
+            note_own_index(conversation_id, result)
+            results = json.loads(tool_text(result, "[]"))
+            if len(results) != len(queries):
+                raise ValueError(f"expected {len(queries)} results, got {len(results)}")
+            return results
+
+        except Exception as e:
+            logger.warning("[MCP Skills Error] %s", e)
+            return [f"[MCP Skills Error] {str(e)}"] * len(queries)
+
 class MCPSearchClient:
     """MCP client for web search server"""
 
+    def __init__(self, pool: MCPSessionPool = mcp_pool):
+        self.pool = pool
+
     async def search_resources(self, refined_query: str, skill_summary: str = "") -> str:
         """Call the search MCP server for web resources via stdio"""
         try:
-            print(f"🔍 [MCP Search] Starting search server process...")
-
-            # Start the search MCP server process
-            server_process = await asyncio.create_subprocess_exec(
-                "python", "mcp/search_mcp_stdio.py",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                stdin=asyncio.subprocess.PIPE,
-                cwd="/Users/youness/Desktop/MCP_Project"
-            )
-
-            print(f"✅ [MCP Search] Server process started with PID {server_process.pid}")
-
-            # Create MCP client session
-            print(f"🔗 [MCP Search] Creating stdio client...")
-            async with stdio_client(server_process.stdout, server_process.stdin) as (read_stream, write_stream):
-                print(f"🔗 [MCP Search] Created stdio streams")
-
-                async with ClientSession(read_stream, write_stream) as session:
-                    print(f"🚀 [MCP Search] Initializing session...")
-                    # Initialize the session
-                    await session.initialize()
-                    print(f"✅ [MCP Search] Session initialized successfully")
-
-                    print(f"📞 [MCP Search] Calling websearch_resources tool with: {refined_query}")
-                    # Call the websearch_resources tool
-                    result = await session.call_tool(
-                        "websearch_resources",
-                        arguments={
-                            "refined_query": refined_query,
-                            "skill_summary": skill_summary
-                        }
-                    )
-                    print(f"✅ [MCP Search] Tool call completed successfully")
-
-                    # Cleanup
-                    server_process.terminate()
-                    await server_process.wait()
-                    print(f"🧹 [MCP Search] Server process cleaned up")
-
-                    return result.content[0].text if result.content else "No search results"
+            with span("mcp.call_tool", tool="websearch_resources"):
+                result = await self.pool.call_tool(
+                    "search", "websearch_resources",
+                    arguments={
+                        "refined_query": refined_query,
+                        "skill_summary": skill_summary
+                    }
+                )
+            telemetry.record_spans((result.meta or {}).get("spans"))
+            return tool_text(result, "No search results")
 
         except Exception as e:
-            print(f"❌ [MCP Search Error] {str(e)}")
+            logger.warning("[MCP Search Error] %s", e)
             return f"[MCP Search Error] {str(e)}"
 
-# ------------------ Run Agent ------------------
-async def run_mcp_agent(user_input, conversation_id):
-    """MCP-based agent using distributed microservices"""
-    answer_cache_key = f"answer:{conversation_id}:{user_input}"
-    cached_answer = clientagt_cache.get(answer_cache_key)
-    if cached_answer:
-        return cached_answer
-
-    try:
-        groq_client = get_groq_client()
+# ------------------ Agent Stages ------------------
+# Each stage publishes its result under its own name; the graph runs a stage
+# as soon as the values it lists as inputs exist. Skills and search both only
+# need the refined query, so they run concurrently.
+# Stage outputs that mean the stage failed; these are never cached
+ERROR_PREFIXES = (
+    "Refined intent from user:",
+    "[MCP Skills Error]", "[MCP Search Error]",
+    "[RAG Error]", "[Local RAG Error]", "[Search Error]", "[DuckDuckGo Search Error]",
+)
 
-        # Step 1: Refine query
-        refine_plugin = QueryRefinerPlugin()
-        refined_query = await refine_plugin.refine_query(user_input)
+def is_error_result(value):
+    return isinstance(value, str) and value.startswith(ERROR_PREFIXES)
+
+class StageFailed(RuntimeError):
+    """A tool call came back as an error result; the graph publishes the stage's fallback instead"""
+
+def raise_if_error(value):
+    if is_error_result(value):
+        raise StageFailed(value)
+    return value
+
+# Concurrent identical work (same stage key, same prompt, same question in the
+# same conversation) waits on one shared call instead of repeating it
+inflight = SingleFlight()
+
+def lookup_stage(stage, key):
+    with span("cache.lookup", cache=stage) as lookup:
+        cached = clientagt_cache.stage_get(stage, key)
+        lookup.outcome = "miss" if cached is None else "hit"
+    return cached
+
+async def cached_stage(stage, key, compute):
+    """Return the cached result of `stage` for `key`, or compute and cache it"""
+    cached = lookup_stage(stage, key)
+    if cached is not None:
+        return cached
+
+    async def compute_and_cache():
+        value = await compute()
+        if not is_error_result(value):
+            clientagt_cache.stage_set(stage, key, value)
+        return value
+
+    return await inflight.do(f"{stage}:{key}", compute_and_cache)
+
+async def refine_stage(user_input):
+    # Keyed by strategy too: a local refinement isn't reused once REFINER_MODE=llm
+    return await cached_stage(
+        "refine", f"{REFINER_MODE}:{clientagt_cache.normalize_query(user_input)}",
+        lambda: create_refiner().refine_query(user_input),
+    )
+
+def skills_key(refined_query, conversation_id):
+    # Skills from the shared index are shared across conversations; a conversation the
+    # server answered from its own CV index (note_own_index) gets keys of its own
+    key = clientagt_cache.normalize_query(refined_query)
+    return f"{conversation_id}:{key}" if clientagt_cache.has_own_index(conversation_id) else key
+
+async def skills_stage(refined_query, conversation_id):
+    cached = lookup_stage("skills", skills_key(refined_query, conversation_id))
+    if cached is not None:
+        return cached
+
+    async def fetch_and_cache():
+        value = await MCPSkillsClient().get_skills(refined_query, conversation_id)
+        # Keyed once the server has said which index answered
+        if not is_error_result(value):
+            clientagt_cache.stage_set("skills", skills_key(refined_query, conversation_id), value)
+        return value
+
+    # Not shared across conversations until the server says they share an index
+    normalized = clientagt_cache.normalize_query(refined_query)
+    return raise_if_error(await inflight.do(f"skills:{conversation_id}:{normalized}", fetch_and_cache))
+
+# A search slower than the recent p90 gets a backup call on another pooled
+# session or endpoint; the first usable result wins
+SEARCH_HEDGE = os.getenv("SEARCH_HEDGE", "1") != "0"
+search_hedge = Hedge("search", initial_delay=float(os.getenv("SEARCH_HEDGE_DELAY", "1.5")),
+                     min_delay=float(os.getenv("SEARCH_HEDGE_MIN_DELAY", "0.3")))
+
+async def search_stage(refined_query):
+    # The search servers don't use skill_summary, so search doesn't wait for skills
+    def search():
+        return MCPSearchClient().search_resources(refined_query)
+
+    # Raised after the hedge, so a failed first call can still be rescued by the backup
+    return raise_if_error(await cached_stage(
+        "search", clientagt_cache.normalize_query(refined_query),
+        (lambda: search_hedge.run(search, is_error=is_error_result, can_hedge=lambda: mcp_pool.has_idle("search")))
+        if SEARCH_HEDGE else search,
+    ))
+
+async def skills_batch_stage(refined_queries, conversation_id=None):
+    """skills_stage() for many queries, with every cache miss fetched in one tool call"""
+    keys = [skills_key(query, conversation_id) for query in refined_queries]
+    results, missing = {}, {}
+    for key, query in zip(keys, refined_queries):
+        if key in results or key in missing:
+            continue
+        cached = lookup_stage("skills", key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            missing[key] = query
+
+    if missing:
+        fetched = await MCPSkillsClient().get_skills_batch(list(missing.values()), conversation_id)
+        for key, query, value in zip(missing, missing.values(), fetched):
+            results[key] = value
+            if not is_error_result(value):
+                clientagt_cache.stage_set("skills", skills_key(query, conversation_id), value)
+    return [results[key] for key in keys]
+
+def build_final_prompt(refined_query, skills_result, search_summary, history=""):
+    # Skills and search results get whatever the budget leaves after the question
+    skills_result, search_summary = fit_to_budget(
+        [str(skills_result), str(search_summary)], PROMPT_TOKEN_BUDGET - count_tokens(refined_query)
+    )
+    # History has its own budget (MEMORY_TOKEN_BUDGET), enforced by conversation_memory
+    conversation = f"Conversation so far:\n{history}\n\n" if history else ""
+    return f"""You are a career assistant. Based on the following information, provide helpful career advice:
+
+{conversation}User Question: {refined_query}
+Current Skills: {skills_result}
+External Resources: {search_summary}
 
-        # Step 2: Get skills from MCP RAG server
-        skills_client = MCPSkillsClient()
-        skills_result = await skills_client.get_skills(refined_query, conversation_id)
+Provide a concise response with actionable advice."""
 
-        # Step 3: Get external resources from MCP search server
-        search_client = MCPSearchClient()
-        search_summary = await search_client.search_resources(refined_query, skills_result)
+async def answer_stage(refined_query, skills_result, search_summary, history):
+    final_prompt = build_final_prompt(refined_query, skills_result, search_summary, history)
+    # Identical prompts in flight share one completion
+    prompt_key = hashlib.sha256(final_prompt.encode("utf-8")).hexdigest()
+    return await inflight.do(f"answer:{prompt_key}", lambda: get_llm_client().chat(
+        messages=[{"role": "user", "content": final_prompt}],
+        temperature=0.7,
+        max_tokens=500
+    ))
+
+# ------------------ Deadlines ------------------
+# Whole-request budget and stage timeouts (0 disables one), shared out so
+# every stage leaves its dependents their own timeout. Optional stages that overrun are replaced by
+# a fallback and the answer is built from what finished.
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "25"))
+STAGE_TIMEOUTS = {
+    "refine": float(os.getenv("REFINE_TIMEOUT", "4")) or None,
+    "skills": float(os.getenv("SKILLS_TIMEOUT", "3")) or None,
+    "search": float(os.getenv("SEARCH_TIMEOUT", "5")) or None,
+    "answer": float(os.getenv("ANSWER_TIMEOUT", "15")) or None,
+}
+UNAVAILABLE = "Not available for this answer."
+
+def refine_fallback(user_input):
+    return LocalRefiner().analyze(user_input)[0]
+
+agent_graph = (
+    StageGraph()
+    .add("refined_query", refine_stage, inputs=["user_input"],
+         timeout=STAGE_TIMEOUTS["refine"], fallback=refine_fallback)
+    .add("skills_result", skills_stage, inputs=["refined_query", "conversation_id"],
+         timeout=STAGE_TIMEOUTS["skills"], fallback=lambda **_: UNAVAILABLE)
+    .add("search_summary", search_stage, inputs=["refined_query"],
+         timeout=STAGE_TIMEOUTS["search"], fallback=lambda **_: UNAVAILABLE)
+    .add("agent_response", answer_stage, inputs=["refined_query", "skills_result", "search_summary", "history"],
+         timeout=STAGE_TIMEOUTS["answer"])
+)
 
-        # Step 4: Generate response with Groq
-        final_prompt = f"""You are a career assistant. Based on the following information, provide helpful career advice:
+# Everything before the final completion, for the streaming endpoint
+retrieval_graph = agent_graph.subgraph("skills_result", "search_summary")
 
-User Question: {refined_query}
-Current Skills: {skills_result}
-External Resources: {search_summary}
+# ------------------ Run Agent ------------------
+# Short stage names used in Server-Timing headers and benchmarks
+STAGE_LABELS = {
+    "refined_query": "refine",
+    "skills_result": "skills",
+    "search_summary": "search",
+    "agent_response": "answer",
+}
+
+class AgentResult:
+    """An answer plus how it was produced"""
+
+    def __init__(self, answer, timings=None, cached=False, skipped=None):
+        self.answer = answer
+        self.timings = timings or {}  # stage label -> seconds
+        self.cached = cached
+        self.skipped = skipped or {}  # stage label -> why its fallback was used
+
+    @classmethod
+    def from_run(cls, answer, run):
+        return cls(
+            answer,
+            {STAGE_LABELS.get(name, name): seconds for name, seconds in run.timings.items()},
+            skipped={STAGE_LABELS.get(name, name): reason for name, reason in run.skipped.items()},
+        )
 
-Provide a concise response with actionable advice."""
+    def server_timing(self):
+        """Server-Timing header value with per-stage durations in ms"""
+        if self.cached:
+            return 'cache;desc="hit"'
+        return ", ".join(
+            f"{label};dur={seconds * 1000:.1f}" + (f';desc="{self.skipped[label]}"' if label in self.skipped else "")
+            for label, seconds in self.timings.items()
+        )
 
-        response = groq_client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=[{"role": "user", "content": final_prompt}],
-            temperature=0.7,
-            max_tokens=500
+def deadline_in(seconds):
+    """loop.time() deadline `seconds` from now; None for no deadline"""
+    return asyncio.get_running_loop().time() + seconds if seconds else None
+
+async def with_llm_deadline(deadline, coro):
+    """Await `coro` with its LLM calls rejected if they can't start by `deadline`"""
+    llm_deadline.set(deadline)
+    return await coro
+
+def lookup_answer(answer_cache_key):
+    with span("cache.lookup", cache="answers") as lookup:
+        cached_answer = clientagt_cache.get(answer_cache_key)
+        lookup.outcome = "hit" if cached_answer else "miss"
+    return cached_answer
+
+async def run_agent(user_input, conversation_id, graph=None, budget=REQUEST_DEADLINE, admission=None, skipped=None,
+                    remember=True, **provided):
+    """Run the stage graph (or serve the cached answer); raises on failure.
+
+    `provided` stage values (e.g. a skills_result fetched in a batch) are
+    used as-is instead of running their stages; `skipped` lists those that
+    are fallbacks (stage -> reason), as in GraphRun.skipped. The prompt
+    gets the conversation's history unless a `history` value is provided;
+    with `remember=False` the exchange isn't added to it. `budget` is the request
+    deadline in seconds (None or 0 for none). With an `admission`
+    controller the graph only runs once it grants a slot; cached answers
+    and requests joining an identical one in flight don't need one.
+    """
+    answer_cache_key = f"answer:{conversation_id}:{user_input}"
+    cached_answer = lookup_answer(answer_cache_key)
+    if cached_answer:
+        return AgentResult(cached_answer, cached=True)
+
+    async def run_graph():
+        # Runs in its own task: LLM calls of every stage must start within the request deadline
+        deadline = deadline_in(budget)
+        llm_deadline.set(deadline)
+        inputs = {"history": conversation_memory.render(conversation_id), **provided}
+        run = await (graph or agent_graph).run(
+            deadline=deadline, user_input=user_input, conversation_id=conversation_id, **inputs
         )
+        run.skipped.update(skipped or {})
+        agent_response = run["agent_response"]
 
-        agent_response = response.choices[0].message.content.strip()
+        # Cache the results; a degraded answer isn't worth serving again
+        if remember:
+            conversation_memory.record(conversation_id, user_input, agent_response)
+        if not run.skipped:
+            clientagt_cache.set(answer_cache_key, agent_response)
 
-        # Cache the results
-        clientagt_cache.append(conversation_id, "user", user_input)
-        clientagt_cache.append(conversation_id, "assistant", agent_response)
-        clientagt_cache.set(answer_cache_key, agent_response)
+        return AgentResult.from_run(agent_response, run)
 
-        return agent_response
+    async def admitted_run_graph():
+        async with admission.slot():
+            return await run_graph()
 
+    # A repeated submit of the same question joins the run already in flight
+    return await inflight.do(answer_cache_key, admitted_run_graph if admission else run_graph)
+
+async def run_mcp_agent(user_input, conversation_id):
+    """MCP-based agent using distributed microservices"""
+    try:
+        result = await run_agent(user_input, conversation_id)
+        return result.answer
+
+    except (LLMRateLimited, StageTimeout):
+        raise
     except Exception as e:
         return f"Error processing request: {str(e)}"
 
+# Stage results reported to streaming clients, by public event name
+STREAM_STAGE_EVENTS = {
+    "refined_query": "refined",
+    "skills_result": "skills",
+    "search_summary": "resources",
+}
+
+async def stream_mcp_agent(user_input, conversation_id, admission=None):
+    """Yield (event, data) pairs: stage progress, answer tokens, then done.
+
+    With an `admission` controller, an answer not served from the cache
+    holds a slot until the stream ends; a shed request raises Overloaded
+    before its first event.
+    """
+    answer_cache_key = f"answer:{conversation_id}:{user_input}"
+    cached_answer = lookup_answer(answer_cache_key)
+    if cached_answer:
+        yield "token", {"text": cached_answer}
+        yield "done", {"answer": cached_answer, "cached": True}
+        return
+
+    async with admission.slot() if admission else nullcontext():
+        async for event, data in stream_answer(user_input, conversation_id, answer_cache_key):
+            yield event, data
+
+async def stream_answer(user_input, conversation_id, answer_cache_key):
+    """stream_mcp_agent() for an answer that isn't cached"""
+    progress = asyncio.Queue()
+    request_deadline = deadline_in(REQUEST_DEADLINE)
+    # Retrieval must leave the answer its budget; the answer then streams as it is generated
+    retrieval_budget = REQUEST_DEADLINE and max(REQUEST_DEADLINE - STAGE_TIMEOUTS["answer"], 0.001)
+    run_task = asyncio.create_task(with_llm_deadline(request_deadline, retrieval_graph.run(
+        on_stage_done=lambda name, value: progress.put_nowait((name, value)),
+        deadline=deadline_in(retrieval_budget),
+        user_input=user_input,
+        conversation_id=conversation_id,
+    )))
+    run_task.add_done_callback(lambda _: progress.put_nowait(None))
+    try:
+        while (item := await progress.get()) is not None:
+            name, value = item
+            yield "stage", {"stage": STREAM_STAGE_EVENTS.get(name, name), "value": value}
+        run = run_task.result()
+
+        tokens = []
+        history = conversation_memory.render(conversation_id)
+        final_prompt = build_final_prompt(run["refined_query"], run["skills_result"], run["search_summary"], history)
+        async for delta in get_llm_client().stream_chat(
+            messages=[{"role": "user", "content": final_prompt}],
+            temperature=0.7,
+            max_tokens=500,
+            deadline=request_deadline,
+        ):
+            tokens.append(delta)
+            yield "token", {"text": delta}
+        agent_response = "".join(tokens).strip()
+
+        conversation_memory.record(conversation_id, user_input, agent_response)
+        if not run.skipped:
+            clientagt_cache.set(answer_cache_key, agent_response)
+        skipped = AgentResult.from_run(agent_response, run).skipped
+        yield "done", {"answer": agent_response, "cached": False, "skipped_stages": sorted(skipped)}
+
+    except LLMRateLimited as e:
+        yield "error", {"message": str(e), "retry_after": round(e.retry_after, 1)}
+    except Exception as e:
+        yield "error", {"message": f"Error processing request: {str(e)}"}
+    finally:
+        # Client disconnected or stream failed: stop any stage still running
+        run_task.cancel()
+
+# ------------------ Batch ------------------
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+# Per batch: how many questions may be in LLM calls, and in web search, at once
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "4"))
+
+async def at_batch_priority(coro):
+    """Await `coro` with its LLM calls queued behind interactive ones"""
+    llm_priority.set(PRIORITY_BATCH)
+    return await coro
+
+async def run_batch(questions, conversation_id=None, admission=None):
+    """Yield (indices, AgentResult) as each distinct question is answered.
+
+    Identical questions (after normalization) are answered once and
+    reported for every index they appear at. Questions are refined first,
+    then all skills lookups go to the skills server as one batched tool
+    call, then search and the final answer run per question through the
+    regular stage graph with bounded concurrency. With an `admission`
+    controller a batch with uncached questions holds one slot while it
+    runs; a shed batch raises Overloaded before its first result.
+    """
+    groups = {}
+    for index, question in enumerate(questions):
+        groups.setdefault(clientagt_cache.normalize_query(question), []).append(index)
+
+    cached, todo = [], []
+    for indices in groups.values():
+        question = questions[indices[0]]
+        cached_answer = lookup_answer(f"answer:{conversation_id}:{question}")
+        if cached_answer:
+            cached.append((indices, AgentResult(cached_answer, cached=True)))
+        else:
+            todo.append((indices, question))
+
+    # A batch runs far longer than a chat, so it doesn't count towards predicted waits
+    async with admission.slot(observe=False) if admission and todo else nullcontext():
+        for indices, result in cached:
+            yield indices, result
+        if todo:
+            async for indices, result in answer_batch(todo, conversation_id):
+                yield indices, result
+
+async def answer_batch(todo, conversation_id):
+    """run_batch() for the (indices, question) pairs not answered from the cache"""
+    llm_slots = asyncio.Semaphore(max(1, BATCH_LLM_CONCURRENCY))
+    search_slots = asyncio.Semaphore(max(1, BATCH_SEARCH_CONCURRENCY))
+    # Batch LLM calls queue in the scheduler behind interactive ones, up to
+    # LLM_BATCH_MAX_QUEUE_WAIT; a stage timeout would count that queueing too
+    graph = agent_graph.without_timeouts("refined_query", "agent_response").bounded({
+        "refined_query": llm_slots,
+        "search_summary": search_slots,
+        "agent_response": llm_slots,
+    })
+    refine = graph.subgraph("refined_query")
+
+    refined = await asyncio.gather(
+        *(at_batch_priority(refine.run(user_input=question)) for indices, question in todo), return_exceptions=True
+    )
+    refined_queries = [
+        run["refined_query"] if not isinstance(run, BaseException) else f"Refined intent from user: {question}"
+        for run, (indices, question) in zip(refined, todo)
+    ]
+    refine_skipped = [
+        run.skipped if not isinstance(run, BaseException) else {"refined_query": "error"} for run in refined
+    ]
+    skills = await skills_batch_stage(refined_queries, conversation_id)
+
+    # Every question sees the history as it was when the batch started, and
+    # the batch doesn't add to it: its questions are independent of each other
+    history = conversation_memory.render(conversation_id)
+
+    # A failed batched lookup isn't passed on as skills: the question's own
+    # skills stage retries it, and falls back (marked skipped) if that fails too
+    tasks = {
+        asyncio.create_task(at_batch_priority(run_agent(
+            question, conversation_id, graph=graph, budget=None, skipped=skipped, remember=False,
+            history=history, refined_query=refined_query,
+            **({} if is_error_result(skills_result) else {"skills_result": skills_result})
+        ))): indices
+        for (indices, question), refined_query, skipped, skills_result
+        in zip(todo, refined_queries, refine_skipped, skills)
+    }
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    result = AgentResult(f"Error processing request: {str(e)}")
+                yield tasks[task], result
+    finally:
+        # Client went away: don't keep answering for nobody
+        for task in tasks:
+            task.cancel()
+
 # Keep old function as fallback
 async def run_simple_agent(user_input, conversation_id):
     """Fallback to direct integration if MCP fails"""
     try:
         return await run_mcp_agent(user_input, conversation_id)
+    except (LLMRateLimited, StageTimeout):
+        # The fallback would make the same LLM calls, or start over after the deadline
+        raise
     except Exception as e:
-        print(f"MCP failed, falling back to direct integration: {e}")
+        logger.warning("MCP failed, falling back to direct integration: %s", e)
         # Original direct implementation as fallback
         from local_rag import query_local_rag
         from duckduckgo_search import DDGS
 
-        groq_client = get_groq_client()
-        refine_plugin = QueryRefinerPlugin()
-        refined_query = await refine_plugin.refine_query(user_input)
+        refined_query = await create_refiner().refine_query(user_input)
 
         skills_result = query_local_rag(refined_query, conversation_id)
         ddgs = DDGS()
-        search_results = ddgs.text(f"{refined_query} skills training courses resources", max_results=3)
+        search_results = await asyncio.to_thread(
+            ddgs.text, f"{refined_query} skills training courses resources", max_results=3
+        )
         search_summary = "\n".join([f"• {r.get('title', 'No title')}: {r.get('href', 'No URL')}" for r in search_results[:3]])
 
         final_prompt = f"""Career advice based on:
@@ -248,17 +595,28 @@ User Question: {refined_query}
 Skills: {skills_result}
 Resources: {search_summary}"""
 
-        response = groq_client.chat.completions.create(
-            model=GROQ_MODEL,
+        return await get_llm_client().chat(
             messages=[{"role": "user", "content": final_prompt}],
             temperature=0.7,
             max_tokens=500
         )
 
-        return response.choices[0].message.content.strip()
-
 # ------------------ FastAPI App ------------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await mcp_pool.start()
+    get_llm_client()
+    await asyncio.to_thread(llm_scheduler.warm_up)
+    if REFINER_MODE != "llm":
+        # The local refiner's index lookups, loaded here so no request pays for them on the loop
+        await asyncio.to_thread(query_refiner.warm_up)
+    yield
+    await conversation_memory.close()
+    await mcp_pool.close()
+    await close_llm_client()
+    clientagt_cache.close()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -270,10 +628,161 @@ class ChatRequest(BaseModel):
     Question: str
     conversation_id: str = None
 
+# Bounds the chats running at once; the rest queue briefly or are shed (client/admission.py)
+admission = AdmissionController()
+
+def overloaded_response(e: Overloaded):
+    return JSONResponse(
+        status_code=e.status,
+        content={"error": str(e)},
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
 @app.post("/api/agtchat")
 async def chat(req: ChatRequest):
-    answer = await run_simple_agent(req.Question, req.conversation_id)
-    return JSONResponse(content={"answer": answer})
+    started = time.perf_counter()
+    with span("request", endpoint="agtchat") as request_span:
+        try:
+            result = await run_agent(req.Question, req.conversation_id, admission=admission)
+        except Overloaded as e:
+            request_span.outcome = "shed"
+            return overloaded_response(e)
+        except LLMRateLimited as e:
+            request_span.outcome = "rate_limited"
+            return JSONResponse(
+                status_code=429,
+                content={"error": str(e)},
+                headers={"Retry-After": str(max(1, round(e.retry_after)))},
+            )
+        except StageTimeout as e:
+            request_span.outcome = "timeout"
+            return JSONResponse(status_code=504, content={"error": str(e)})
+        except Exception as e:
+            request_span.outcome = "error"
+            result = AgentResult(f"Error processing request: {str(e)}")
+    server_timing = result.server_timing()
+    total = f"total;dur={(time.perf_counter() - started) * 1000:.1f}"
+    return JSONResponse(
+        content={"answer": result.answer, "skipped_stages": sorted(result.skipped)},
+        headers={"Server-Timing": f"{server_timing}, {total}" if server_timing else total},
+    )
+
+class BatchChatRequest(BaseModel):
+    Questions: List[str]
+    conversation_id: str = None
+    stream: bool = False
+
+@app.post("/api/agtchat/batch")
+async def chat_batch(req: BatchChatRequest):
+    if len(req.Questions) > BATCH_MAX_QUESTIONS:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch"},
+        )
+
+    def item(index, result):
+        return {"index": index, "question": req.Questions[index], "answer": result.answer, "cached": result.cached,
+                "skipped_stages": sorted(result.skipped)}
+
+    if req.stream:
+        batch = run_batch(req.Questions, req.conversation_id, admission=admission)
+        try:
+            # Admission is decided before the first result, so a shed batch gets a plain 429/503
+            first = await anext(batch, None)
+        except Overloaded as e:
+            return overloaded_response(e)
+
+        # One JSON object per line, in completion order
+        def item_lines(indices, result):
+            return "".join(json.dumps(item(index, result)) + "\n" for index in indices)
+
+        async def lines():
+            with span("request", endpoint="agtchat_batch_stream"):
+                if first is not None:
+                    yield item_lines(*first)
+                async for indices, result in batch:
+                    yield item_lines(indices, result)
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    results = [None] * len(req.Questions)
+    unique = 0
+    with span("request", endpoint="agtchat_batch") as request_span:
+        try:
+            async for indices, result in run_batch(req.Questions, req.conversation_id, admission=admission):
+                unique += 1
+                for index in indices:
+                    results[index] = item(index, result)
+        except Overloaded as e:
+            request_span.outcome = "shed"
+            return overloaded_response(e)
+    return JSONResponse(content={"results": results, "unique": unique})
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/agtchat/stream")
+async def chat_stream(req: ChatRequest):
+    stream = stream_mcp_agent(req.Question, req.conversation_id, admission=admission)
+    try:
+        # Admission is decided before the first event, so a shed request gets a plain 429/503
+        first = await anext(stream)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    async def events():
+        with span("request", endpoint="agtchat_stream"):
+            yield _sse(*first)
+            async for event, data in stream:
+                yield _sse(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return JSONResponse(content={**clientagt_cache.stats(), "inflight": inflight.stats()})
+
+@app.get("/api/mcp/pool")
+async def pool_stats():
+    return JSONResponse(content={**mcp_pool.stats(), "hedging": {"search": search_hedge.stats()}})
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    return JSONResponse(content=get_llm_client().scheduler.stats())
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    return JSONResponse(content=admission.stats())
+
+# ------------------ Metrics ------------------
+# Span histograms are filled as requests run; cache, pool and in-flight
+# numbers are read from their stats at scrape time
+def _cache_samples(field):
+    return [({"cache": name}, values[field]) for name, values in clientagt_cache.stats().items()]
+
+def _pool_samples(field):
+    return [({"server": name}, values.get(field, 0)) for name, values in mcp_pool.stats()["servers"].items()]
+
+telemetry.gauge("agent_cache_hit_ratio", "Cache hits / lookups", lambda: _cache_samples("hit_ratio"))
+telemetry.gauge("agent_cache_entries", "Entries held per cache", lambda: _cache_samples("entries"))
+telemetry.gauge("agent_cache_bytes", "Estimated bytes held per cache", lambda: _cache_samples("bytes"))
+telemetry.gauge("agent_cache_evictions", "Entries evicted per cache", lambda: _cache_samples("evictions"))
+telemetry.gauge("agent_mcp_sessions_idle", "Idle pooled MCP sessions", lambda: _pool_samples("idle"))
+telemetry.gauge("agent_mcp_sessions_in_use", "Checked-out MCP sessions", lambda: _pool_samples("in_use"))
+telemetry.gauge("agent_mcp_call_errors", "MCP tool calls that failed", lambda: _pool_samples("call_errors"))
+telemetry.gauge("agent_llm_queued", "LLM calls waiting for rate-limit capacity",
+                lambda: [({}, get_llm_client().scheduler.stats()["queued_now"])])
+telemetry.gauge("agent_admission_inflight", "Chats holding an admission slot", lambda: [({}, admission.inflight)])
+telemetry.gauge("agent_admission_queued", "Chats waiting for an admission slot", lambda: [({}, admission.queued())])
+telemetry.gauge("agent_inflight_calls", "Coalesced calls in flight", lambda: [({}, inflight.stats()["in_flight"])])
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run("client_agent:app", host="0.0.0.0", port=7081, reload=True)
@@ -1,30 +1,592 @@
-import json, uuid
-from typing import Dict, List
+import os, sys, json, time, uuid, atexit, sqlite3, threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from telemetry import get_logger
+from local_rag import normalize_query
 
-# Simple in-memory cache (no Redis needed)
-_memory_cache: Dict[str, any] = {}
-_conversations: Dict[str, List[Dict[str, str]]] = {}
+logger = get_logger("clientagt_cache")
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# "memory" keeps caches in this process; "sqlite" shares them between the
+# uvicorn workers on one host through a WAL-mode database file
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(PROJECT_ROOT, "clientagt_cache.db"))
+CACHE_FLUSH_INTERVAL = float(os.getenv("CACHE_FLUSH_INTERVAL", "0.05"))
+CACHE_WRITE_BATCH = int(os.getenv("CACHE_WRITE_BATCH", "256"))
+# Failed flushes in a row after which queued writes are dropped, and the most
+# writes kept queued meanwhile (the oldest go first), so a broken database
+# (disk full, locked) can't grow the queue without bound
+CACHE_FLUSH_RETRIES = int(os.getenv("CACHE_FLUSH_RETRIES", "5"))
+CACHE_MAX_PENDING = int(os.getenv("CACHE_MAX_PENDING", "10000"))
+
+# Budgets (0 disables a limit). Sizes are estimates of the Python objects held.
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "3600"))
+CONVERSATION_MAX_COUNT = int(os.getenv("CONVERSATION_MAX_COUNT", "10000"))
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "40"))
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(24 * 3600)))
+
+# Conversation-independent stage results, shared by every user
+STAGE_CACHE_TTLS = {
+    "refine": float(os.getenv("REFINE_CACHE_TTL", str(24 * 3600))),
+    "skills": float(os.getenv("SKILLS_CACHE_TTL", "3600")),
+    "search": float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600))),
+}
+
+
+def _estimate_size(value: Any) -> int:
+    """Rough in-memory size of a cached value in bytes"""
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    try:
+        return sys.getsizeof(json.dumps(value))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class CacheBackend(ABC):
+    """Interface shared by the cache backends.
+
+    Every cache is a namespace (`name`) of JSON-serializable values with a
+    default TTL and entry/byte budgets; `append` adds to a list value in
+    one step so concurrent writers don't lose each other's items.
+    """
+
+    name = "cache"
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def append(self, key: str, item: Any, max_items: int = 0, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+
+class LRUCache(CacheBackend):
+    """LRU cache with per-entry TTL and entry/byte budgets.
+
+    Entries live in an OrderedDict in recency order, so lookups, inserts and
+    evictions are all O(1). Expired entries are dropped when they are read
+    or when they reach the cold end of the LRU.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL, name: str = "cache"):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, expires_at, size)
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key: str):
+        value, expires_at, size = self._data.pop(key)
+        self.bytes -= size
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at, size = entry
+        if expires_at and expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        size = _estimate_size(key) + _estimate_size(value)
+        if key in self._data:
+            self._remove(key)
+        if self.max_bytes and size > self.max_bytes:
+            return  # larger than the whole budget: not cacheable
+        self._data[key] = (value, time.monotonic() + ttl if ttl else 0.0, size)
+        self.bytes += size
+        while (self.max_entries and len(self._data) > self.max_entries) or \
+                (self.max_bytes and self.bytes > self.max_bytes):
+            old_key, (old_value, old_expires, old_size) = self._data.popitem(last=False)
+            self.bytes -= old_size
+            self.evictions += 1
+
+    def append(self, key: str, item: Any, max_items: int = 0, ttl: Optional[float] = None):
+        # Not a lookup, so not counted as a hit or miss; copied because get()
+        # handed the stored list to callers
+        entry = self._data.get(key)
+        live = entry is not None and not (entry[1] and entry[1] <= time.monotonic())
+        items = list(entry[0]) if live else []
+        items.append(item)
+        if max_items and len(items) > max_items:
+            del items[:-max_items]
+        # Re-set to refresh the TTL and the byte accounting
+        self.set(key, items, ttl)
+
+    def delete(self, key: str):
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class _SQLiteStore:
+    """One WAL-mode SQLite database shared by every process on the host.
+
+    Reads go straight to the database on a per-thread connection. Writes
+    are queued and applied by a background thread in one transaction every
+    CACHE_FLUSH_INTERVAL seconds (or once CACHE_WRITE_BATCH are queued), so
+    request handlers never wait on a commit. Until its write is committed,
+    a key's new value is served from an in-memory overlay, so a process
+    always sees its own writes. A write that fails is logged and dropped on
+    its own; the rest of the batch still commits.
+    """
+
+    def __init__(self, path: str = CACHE_DB_PATH, flush_interval: float = CACHE_FLUSH_INTERVAL,
+                 write_batch: int = CACHE_WRITE_BATCH, flush_retries: int = CACHE_FLUSH_RETRIES,
+                 max_pending: int = CACHE_MAX_PENDING):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.write_batch = write_batch
+        self.flush_retries = flush_retries
+        self.max_pending = max_pending
+        self._failed_flushes = 0
+        self.dropped_writes = 0
+        self._local = threading.local()
+        self._pending: List[tuple] = []  # (seq, op)
+        self._seq = 0
+        # (ns, key) -> (seq, encoded value or None if deleted, expires_at) for uncommitted writes
+        self._overlay: Dict[tuple, tuple] = {}
+        self._cleared: Dict[str, int] = {}  # ns -> seq of an uncommitted clear
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.budgets: Dict[str, tuple] = {}  # ns -> (max_entries, max_bytes)
+        self.evictions: Dict[str, int] = {}
+        self.expirations: Dict[str, int] = {}
+        self.flushes = 0
+        self._last_sweep = 0.0
+
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+                expires_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL,
+                PRIMARY KEY (ns, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (ns, accessed_at);
+        """)
+        self._writer = threading.Thread(target=self._run, name="cache-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    # -- writes --
+    def queue(self, op: tuple, overlay: Optional[tuple] = None):
+        """Queue a write; `overlay` is (encoded value or None, expires_at) to serve until it commits"""
+        with self._lock:
+            self._seq += 1
+            self._pending.append((self._seq, op))
+            if overlay is not None:
+                self._overlay[(op[1], op[2])] = (self._seq,) + overlay
+            elif op[0] == "clear":
+                self._cleared[op[1]] = self._seq
+                for ns_key in [ns_key for ns_key in self._overlay if ns_key[0] == op[1]]:
+                    del self._overlay[ns_key]
+            if len(self._pending) >= self.write_batch:
+                self._wake.set()
+
+    def pending(self, ns: str, key: str) -> Optional[tuple]:
+        """(encoded value or None, expires_at) of an uncommitted write of this process, else None"""
+        with self._lock:
+            entry = self._overlay.get((ns, key))
+            if entry is not None:
+                return entry[1:]
+            if ns in self._cleared:
+                return (None, 0.0)
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.error("SQLite cache flush failed: %s", e)
+
+    def flush(self):
+        """Apply every queued write in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            conn = self.connection()
+            now = time.time()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for seq, op in batch:
+                        # One bad write (e.g. a NULL key) must not cost the others theirs
+                        conn.execute("SAVEPOINT op")
+                        try:
+                            self._apply(conn, op, now)
+                        except sqlite3.Error as e:
+                            conn.execute("ROLLBACK TO op")
+                            logger.error("Dropped cache write %s %s/%r: %s", op[0], op[1], op[2], e)
+                        conn.execute("RELEASE op")
+                    for ns in {op[1] for seq, op in batch if op[0] != "delete"}:
+                        self._enforce_budget(conn, ns)
+                    if now - self._last_sweep > 60:
+                        self._sweep(conn, now)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            except BaseException:
+                # Database busy or unavailable: keep the writes for the next flush, up to a point
+                self._failed_flushes += 1
+                if self._failed_flushes >= self.flush_retries:
+                    self._drop(batch, f"{self._failed_flushes} flushes in a row failed")
+                    self._failed_flushes = 0
+                else:
+                    with self._lock:
+                        self._pending[:0] = batch
+                        excess = self._pending[:max(0, len(self._pending) - self.max_pending)]
+                        del self._pending[:len(excess)]
+                    if excess:
+                        self._drop(excess, f"more than {self.max_pending} writes queued")
+                raise
+            self._failed_flushes = 0
+            self._forget(batch[-1][0])
+            self.flushes += 1
+
+    def _forget(self, last: int):
+        """Stop serving queued writes up to seq `last` from the overlay (committed or dropped)"""
+        with self._lock:
+            self._overlay = {ns_key: entry for ns_key, entry in self._overlay.items() if entry[0] > last}
+            self._cleared = {ns: seq for ns, seq in self._cleared.items() if seq > last}
+
+    def _drop(self, ops: List[tuple], reason: str):
+        self.dropped_writes += len(ops)
+        logger.error("Dropped %d queued cache writes: %s", len(ops), reason)
+        self._forget(ops[-1][0])
+
+    def _apply(self, conn: sqlite3.Connection, op: tuple, now: float):
+        kind, ns, key = op[:3]
+        if kind == "set":
+            value, expires_at = op[3], op[4]
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (ns, key, value, expires_at, now, len(value)),
+            )
+        elif kind == "append":
+            item, max_items, expires_at = op[3], op[4], op[5]
+            row = conn.execute(
+                "SELECT value, expires_at FROM entries WHERE ns = ? AND key = ?", (ns, key)
+            ).fetchone()
+            items = json.loads(row[0]) if row and not (row[1] and row[1] <= now) else []
+            items.append(item)
+            if max_items and len(items) > max_items:
+                del items[:-max_items]
+            value = json.dumps(items)
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (ns, key, value, expires_at, now, len(value)),
+            )
+        elif kind == "touch":
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE ns = ? AND key = ?", (op[3], ns, key))
+        elif kind == "delete":
+            conn.execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, key))
+        elif kind == "clear":
+            conn.execute("DELETE FROM entries WHERE ns = ?", (ns,))
+
+    def _enforce_budget(self, conn: sqlite3.Connection, ns: str):
+        """Evict least recently used entries of `ns` until it fits its budgets"""
+        max_entries, max_bytes = self.budgets.get(ns, (0, 0))
+        count, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE ns = ?", (ns,)
+        ).fetchone()
+        evicted = 0
+        if max_entries and count > max_entries:
+            evicted += conn.execute(
+                "DELETE FROM entries WHERE ns = ? AND key IN "
+                "(SELECT key FROM entries WHERE ns = ? ORDER BY accessed_at LIMIT ?)",
+                (ns, ns, count - max_entries),
+            ).rowcount
+        if max_bytes and size > max_bytes:
+            for key, entry_size in conn.execute(
+                "SELECT key, size FROM entries WHERE ns = ? ORDER BY accessed_at", (ns,)
+            ).fetchall():
+                if size <= max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, key))
+                size -= entry_size
+                evicted += 1
+        if evicted:
+            self.evictions[ns] = self.evictions.get(ns, 0) + evicted
+
+    def _sweep(self, conn: sqlite3.Connection, now: float):
+        for ns, count in conn.execute(
+            "SELECT ns, COUNT(*) FROM entries WHERE expires_at > 0 AND expires_at <= ? GROUP BY ns", (now,)
+        ).fetchall():
+            self.expirations[ns] = self.expirations.get(ns, 0) + count
+        conn.execute("DELETE FROM entries WHERE expires_at > 0 AND expires_at <= ?", (now,))
+        self._last_sweep = now
+
+    def close(self):
+        """Flush queued writes and stop the writer thread"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        self._writer.join(timeout=5)
+        self.flush()
+
+
+class SQLiteCache(CacheBackend):
+    """A cache namespace stored in a _SQLiteStore shared across processes.
+
+    Same budgets and TTL semantics as LRUCache. Recency is updated in the
+    background from reads, so eviction is approximately LRU. Hit and miss
+    counters are per process.
+    """
+
+    def __init__(self, store: _SQLiteStore, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL, name: str = "cache"):
+        self.store = store
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        store.budgets[name] = (max_entries, max_bytes)
+
+    def _expires_at(self, ttl: Optional[float]) -> float:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else 0.0
+
+    def _read(self, key: str):
+        """(encoded value, expires_at) as this process sees it, or None"""
+        pending = self.store.pending(self.name, key)
+        if pending is not None:
+            return pending if pending[0] is not None else None
+        return self.store.connection().execute(
+            "SELECT value, expires_at FROM entries WHERE ns = ? AND key = ?", (self.name, key)
+        ).fetchone()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._read(key)
+        now = time.time()
+        if row is None or (row[1] and row[1] <= now):
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.store.queue(("touch", self.name, key, now))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        encoded = json.dumps(value)
+        if self.max_bytes and len(encoded) > self.max_bytes:
+            return  # larger than the whole budget: not cacheable
+        expires_at = self._expires_at(ttl)
+        self.store.queue(("set", self.name, key, encoded, expires_at), overlay=(encoded, expires_at))
+
+    def append(self, key: str, item: Any, max_items: int = 0, ttl: Optional[float] = None):
+        # Read-modify-write happens inside the writer's transaction, so
+        # appends from different workers to one conversation all land;
+        # the overlay only shows this process's view until then
+        row = self._read(key)
+        items = json.loads(row[0]) if row and not (row[1] and row[1] <= time.time()) else []
+        items.append(item)
+        if max_items and len(items) > max_items:
+            del items[:-max_items]
+        expires_at = self._expires_at(ttl)
+        self.store.queue(("append", self.name, key, item, max_items, expires_at),
+                         overlay=(json.dumps(items), expires_at))
+
+    def delete(self, key: str):
+        self.store.queue(("delete", self.name, key), overlay=(None, 0.0))
+
+    def clear(self):
+        self.store.queue(("clear", self.name, ""))
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = self.store.connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE ns = ?", (self.name,)
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.store.evictions.get(self.name, 0),
+            "expirations": self.store.expirations.get(self.name, 0),
+        }
+
+
+_sqlite_store: Optional[_SQLiteStore] = None
+
+def make_cache(name: str, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+               ttl: float = CACHE_TTL, backend: str = CACHE_BACKEND) -> CacheBackend:
+    """A cache namespace on the configured backend"""
+    global _sqlite_store
+    if backend == "memory":
+        return LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, name=name)
+    if backend == "sqlite":
+        if _sqlite_store is None:
+            _sqlite_store = _SQLiteStore()
+        return SQLiteCache(_sqlite_store, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, name=name)
+    raise ValueError(f"Unknown CACHE_BACKEND '{backend}' (expected 'memory' or 'sqlite')")
+
+
+# Bounded caches (no Redis needed)
+_memory_cache = make_cache("answers")
+_conversations = make_cache(
+    "conversations", max_entries=CONVERSATION_MAX_COUNT, max_bytes=CACHE_MAX_BYTES, ttl=CONVERSATION_TTL
+)
+# Rolling summary of each conversation's older turns (see conversation_memory.py)
+_summaries = make_cache(
+    "summaries", max_entries=CONVERSATION_MAX_COUNT, max_bytes=CACHE_MAX_BYTES, ttl=CONVERSATION_TTL
+)
+
+# Conversations the skills server answered from their own CV index (rag_tenants.py)
+_own_indexes = make_cache(
+    "own_indexes", max_entries=CONVERSATION_MAX_COUNT, max_bytes=CACHE_MAX_BYTES, ttl=CONVERSATION_TTL
+)
+
+_stage_caches = {
+    stage: make_cache(stage, ttl=ttl) for stage, ttl in STAGE_CACHE_TTLS.items()
+}
+
+def stage_get(stage: str, key: str):
+    """Get a cached stage result"""
+    return _stage_caches[stage].get(key)
+
+def stage_set(stage: str, key: str, value: Any):
+    """Cache a stage result with that stage's TTL"""
+    _stage_caches[stage].set(key, value)
+
+def has_own_index(cid: Optional[str]) -> bool:
+    """Whether the conversation's skills come from its own CV index, so aren't shared"""
+    return cid is not None and bool(_own_indexes.get(cid))
+
+def set_own_index(cid: str):
+    _own_indexes.set(cid, True)
 
 def append(cid: str, role: str, text: str):
-    """Add a message to conversation history"""
-    if cid not in _conversations:
-        _conversations[cid] = []
-    _conversations[cid].append({"role": role, "text": text})
+    """Add a message to conversation history (requests without a conversation id keep none)"""
+    if cid is None:
+        return
+    _conversations.append(cid, {"role": role, "text": text, "ts": time.time()}, CONVERSATION_MAX_MESSAGES)
 
 def fetch(cid: str, last_n: int = 6):
     """Fetch last N conversation items"""
-    items = _conversations.get(cid, [])
+    items = _conversations.get(cid) or []
     # Get last 2*last_n items (each Q/A is two items)
     return items[-2*last_n:] if items else []
 
+def history(cid: str) -> List[Dict[str, Any]]:
+    """Every stored message of a conversation, oldest first"""
+    return _conversations.get(cid) or []
+
+def get_summary(cid: str) -> Optional[Dict[str, Any]]:
+    """{"text", "until"}: summary of the messages with ts <= until"""
+    return _summaries.get(cid)
+
+def set_summary(cid: str, text: str, until: float):
+    _summaries.set(cid, {"text": text, "until": until})
+
 def get(key: str):
     """Get cached value"""
-    return _memory_cache.get(key, None)
+    return _memory_cache.get(key)
+
+def set(key: str, value: str, ttl: Optional[float] = None):
+    """Set cached value (ttl in seconds overrides CACHE_TTL, 0 means no expiry)"""
+    _memory_cache.set(key, value, ttl)
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss/eviction counters and sizes of every cache"""
+    return {
+        "answers": _memory_cache.stats(),
+        "conversations": _conversations.stats(),
+        "summaries": _summaries.stats(),
+        "own_indexes": _own_indexes.stats(),
+        **{f"stage:{stage}": cache.stats() for stage, cache in _stage_caches.items()},
+    }
+
+def flush():
+    """Write out queued cache writes (no-op for the memory backend)"""
+    if _sqlite_store is not None:
+        _sqlite_store.flush()
 
-def set(key: str, value: str):
-    """Set cached value"""
-    _memory_cache[key] = value
+def close():
+    """Flush and stop the shared backend's writer (app shutdown)"""
+    if _sqlite_store is not None:
+        _sqlite_store.close()
 
 def new_conversation_id() -> str:
     """Generate new conversation ID"""
-    return str(uuid.uuid4())
\ No newline at end of file
+    return str(uuid.uuid4())
@@ -0,0 +1,122 @@
+import os
+import asyncio
+from typing import Dict, List, Optional
+from client import clientagt_cache
+from client.llm_client import get_llm_client
+from client.llm_scheduler import PRIORITY_BATCH, count_tokens, llm_deadline, llm_priority, trim_to_tokens
+from telemetry import get_logger, span
+
+logger = get_logger("conversation_memory")
+
+# Tokens of history (summary + recent turns) added to each final prompt
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "800"))
+# Cap on the rolling summary itself
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "250"))
+# Question/answer pairs kept verbatim before they are folded into the summary
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "3"))
+
+ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+# Conversation id -> its running compaction, so there is at most one each
+_compactions: Dict[str, asyncio.Task] = {}
+
+
+def _unsummarized(cid: str):
+    summary = clientagt_cache.get_summary(cid) or {"text": "", "until": 0.0}
+    messages = [m for m in clientagt_cache.history(cid) if m.get("ts", 0.0) > summary["until"]]
+    return summary, messages
+
+def _format(message: Dict[str, str], max_tokens: int) -> str:
+    label = ROLE_LABELS.get(message.get("role"), message.get("role", ""))
+    return f"{label}: {trim_to_tokens(message.get('text', ''), max_tokens)}"
+
+def _recent_budget(summary_text: str) -> int:
+    return MEMORY_TOKEN_BUDGET - min(count_tokens(summary_text), MEMORY_SUMMARY_TOKENS)
+
+def render(cid: Optional[str]) -> str:
+    """Conversation context for the final prompt, at most MEMORY_TOKEN_BUDGET tokens.
+
+    The rolling summary comes first, then as many of the newest
+    unsummarized messages as fit. Messages that don't fit yet are waiting
+    for compaction and are simply left out.
+    """
+    if not cid or MEMORY_TOKEN_BUDGET <= 0:
+        return ""
+    summary, messages = _unsummarized(cid)
+    summary_text = trim_to_tokens(summary["text"], MEMORY_SUMMARY_TOKENS)
+    remaining = _recent_budget(summary_text)
+    # No single message may take more than half of what's left for turns
+    per_message = max(remaining // 2, 1)
+    lines: List[str] = []
+    for message in reversed(messages):
+        line = _format(message, per_message)
+        cost = count_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    parts = [f"Summary of earlier conversation: {summary_text}"] if summary_text else []
+    return "\n".join(parts + lines[::-1])
+
+def record(cid: Optional[str], user_input: str, agent_response: str):
+    """Store one question/answer turn and compact older turns in the background if needed"""
+    clientagt_cache.append(cid, "user", user_input)
+    clientagt_cache.append(cid, "assistant", agent_response)
+    if cid and MEMORY_TOKEN_BUDGET > 0 and cid not in _compactions:
+        summary, messages = _unsummarized(cid)
+        recent_tokens = sum(count_tokens(m.get("text", "")) for m in messages)
+        if len(messages) > 2 * MEMORY_RECENT_TURNS or recent_tokens > _recent_budget(summary["text"]):
+            task = asyncio.create_task(_compact(cid))
+            _compactions[cid] = task
+            task.add_done_callback(lambda _: _compactions.pop(cid, None))
+
+def _split(messages: List[Dict[str, str]], budget: int) -> int:
+    """How many of the oldest messages to fold so the rest fit the verbatim window"""
+    keep = min(len(messages), 2 * MEMORY_RECENT_TURNS)
+    while keep > 2 and sum(count_tokens(m.get("text", "")) for m in messages[-keep:]) > budget:
+        keep -= 2
+    return len(messages) - keep
+
+async def _compact(cid: str):
+    """Fold the older unsummarized turns into the conversation's summary"""
+    summary, messages = _unsummarized(cid)
+    fold = _split(messages, _recent_budget(summary["text"]))
+    if fold <= 0:
+        return
+    older = messages[:fold]
+    transcript = "\n".join(_format(m, MEMORY_SUMMARY_TOKENS) for m in older)
+    prompt = f"""Update the running summary of a career advice conversation with the new messages.
+Keep the user's background, goals, skills and constraints, and the advice already given. Drop pleasantries.
+Reply with the summary only, at most {MEMORY_SUMMARY_TOKENS * 3 // 4} words.
+
+Current summary: {summary["text"] or "(none)"}
+
+New messages:
+{transcript}"""
+    # Compaction is never urgent: it queues behind interactive LLM calls,
+    # and isn't bound by the deadline of the request that started it
+    llm_priority.set(PRIORITY_BATCH)
+    llm_deadline.set(None)
+    with span("memory.compact") as compact_span:
+        try:
+            text = await get_llm_client().chat(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=MEMORY_SUMMARY_TOKENS,
+            )
+        except Exception as e:
+            # Turns stay unsummarized (render() still bounds them); the next turn retries
+            compact_span.outcome = "skipped"
+            logger.warning("Conversation compaction failed for %s: %s", cid, e)
+            return
+    current = clientagt_cache.get_summary(cid)
+    until = older[-1].get("ts", 0.0)
+    if current is None or current["until"] < until:
+        clientagt_cache.set_summary(cid, trim_to_tokens(text, MEMORY_SUMMARY_TOKENS), until)
+
+async def close():
+    """Stop compactions still running (app shutdown)"""
+    tasks = list(_compactions.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,82 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+from telemetry import counter
+
+HEDGES = counter("agent_hedged_calls_total", "Backup calls started because the first was slow")
+HEDGE_WINS = counter("agent_hedge_wins_total", "Hedged calls answered by the backup call")
+
+
+# ------------------ Hedged Calls ------------------
+class Hedge:
+    """Starts a backup call when the first one is slower than usual.
+
+    The delay is the `quantile` of recent call latencies (so about 1 - quantile
+    of calls are hedged, costing that much extra load), never below
+    `min_delay`; until `min_samples` calls have been timed it is `initial_delay`.
+    Attempts that lose the race or are cancelled record the time they ran,
+    a lower bound of their latency, so slow calls still count.
+    Whichever call returns a usable result first wins and the other is
+    cancelled. No backup is started while `can_hedge()` is false, e.g. when
+    it would only queue behind the same busy servers.
+    """
+
+    def __init__(self, name: str, initial_delay: float, min_delay: float = 0.1, quantile: float = 0.9,
+                 window: int = 200, min_samples: int = 20):
+        self.name = name
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self.calls = self.hedged = self.backup_wins = 0
+
+    def delay(self) -> float:
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self._latencies)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))])
+
+    async def run(self, call: Callable[[], Awaitable[Any]], is_error: Optional[Callable[[Any], bool]] = None,
+                  can_hedge: Optional[Callable[[], bool]] = None) -> Any:
+        """Await call(), racing a second call() if the first outlasts delay()"""
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+
+        async def attempt():
+            started = loop.time()
+            try:
+                return await call()
+            finally:
+                self._latencies.append(loop.time() - started)
+
+        first = asyncio.create_task(attempt())
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.delay())
+            if not done and (can_hedge is None or can_hedge()):
+                self.hedged += 1
+                HEDGES.inc(call=self.name)
+                pending.add(asyncio.create_task(attempt()))
+            while True:
+                for task in done:
+                    if task.exception() is None and not (is_error and is_error(task.result())):
+                        if task is not first:
+                            self.backup_wins += 1
+                            HEDGE_WINS.inc(call=self.name)
+                        return task.result()
+                if not pending:
+                    # Every attempt failed: report the last one's outcome
+                    return task.result()
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "backup_wins": self.backup_wins,
+            "delay_ms": round(self.delay() * 1000, 1),
+        }
@@ -0,0 +1,179 @@
+import os
+import asyncio
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+from groq import AsyncGroq, RateLimitError
+from telemetry import span
+from client.llm_scheduler import LLMScheduler, LLMRateLimited, count_message_tokens, count_tokens
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = "llama-3.1-8b-instant"  # Updated free model
+# Point at any OpenAI-compatible server (e.g. bench/fake_llm_server.py); None uses api.groq.com
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+
+# ------------------ Async LLM Client ------------------
+class AsyncLLMClient:
+    """App-scoped async chat client over one keep-alive connection pool.
+
+    Calls never block the event loop, each call has its own timeout, and a
+    semaphore bounds how many completions are in flight at once. Before
+    that, the scheduler holds each call until Groq's request and token
+    rate limits have room for it (see llm_scheduler.py).
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = GROQ_API_KEY,
+        model: str = GROQ_MODEL,
+        base_url: Optional[str] = GROQ_BASE_URL,
+        timeout: float = LLM_TIMEOUT,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        scheduler: Optional[LLMScheduler] = None,
+    ):
+        self.model = model
+        self.scheduler = scheduler or LLMScheduler()
+        self.timeout = timeout
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(timeout, connect=5.0),
+        )
+        self._client = AsyncGroq(
+            api_key=api_key or "missing-api-key",
+            base_url=base_url,
+            http_client=self._http,
+            max_retries=LLM_MAX_RETRIES,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """Run one chat completion and return the stripped message text"""
+        prompt_tokens = count_message_tokens(messages)
+        reserved = prompt_tokens + max_tokens
+        await self.scheduler.acquire(reserved, deadline=deadline)
+        # A failed or cancelled call generated nothing we know of; charge it the prompt
+        used: Optional[int] = prompt_tokens
+        try:
+            async with self._semaphore:
+                with span("llm.completion", mode="chat"), self._rate_limited():
+                    response = await self._client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        timeout=timeout or self.timeout,
+                    )
+            usage = getattr(response, "usage", None)
+            used = usage.total_tokens if usage else None
+        finally:
+            self.scheduler.settle(reserved, used)
+        return response.choices[0].message.content.strip()
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """Run one chat completion and yield text deltas as they arrive.
+
+        Groq reports usage on the last chunk (x_groq.usage); servers that
+        don't are settled with the prompt plus the streamed text counted.
+        """
+        prompt_tokens = count_message_tokens(messages)
+        reserved = prompt_tokens + max_tokens
+        await self.scheduler.acquire(reserved, deadline=deadline)
+        used: Optional[int] = None
+        streamed: List[str] = []
+        try:
+            async with self._semaphore:
+                with span("llm.completion", mode="stream"), self._rate_limited():
+                    stream = await self._client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        timeout=timeout or self.timeout,
+                        stream=True,
+                    )
+                    try:
+                        async for chunk in stream:
+                            usage = _chunk_usage(chunk)
+                            if usage is not None:
+                                used = usage.total_tokens
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if delta:
+                                streamed.append(delta)
+                                yield delta
+                    finally:
+                        await stream.close()
+        finally:
+            if used is None:
+                used = prompt_tokens + count_tokens("".join(streamed))
+            self.scheduler.settle(reserved, used)
+
+    @contextmanager
+    def _rate_limited(self):
+        """Turn Groq's 429 into LLMRateLimited and pause the scheduler for its Retry-After"""
+        try:
+            yield
+        except RateLimitError as e:
+            retry_after = _retry_after(e)
+            self.scheduler.server_rate_limited(retry_after)
+            raise LLMRateLimited("Groq rate limit exceeded", retry_after or 1.0) from e
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+def _chunk_usage(chunk):
+    """Usage on a stream chunk: OpenAI-style `usage` or Groq's `x_groq.usage`"""
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return usage if getattr(usage, "total_tokens", None) is not None else None
+
+
+def _retry_after(error: RateLimitError) -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+_llm_client: Optional[AsyncLLMClient] = None
+
+def get_llm_client() -> AsyncLLMClient:
+    """Shared LLM client, created on first use"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = AsyncLLMClient()
+    return _llm_client
+
+async def close_llm_client():
+    """Close the shared client's connection pool (app shutdown)"""
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
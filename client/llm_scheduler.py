@@ -0,0 +1,286 @@
+import os
+import heapq
+import asyncio
+import itertools
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence
+from telemetry import get_logger, counter
+
+logger = get_logger("llm_scheduler")
+
+# Groq free tier limits (README); 0 disables a limit
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+# How long a call may wait in the queue before it is rejected instead
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "15"))
+LLM_BATCH_MAX_QUEUE_WAIT = float(os.getenv("LLM_BATCH_MAX_QUEUE_WAIT", "600"))
+# Tokens allowed for the final prompt; skills and search results are trimmed to fit
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Priority of LLM calls made from the current task (batch jobs lower it)
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+# loop.time() by which LLM calls from the current task must start (the request deadline)
+llm_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+REJECTED = counter("agent_llm_rejected_total", "LLM calls rejected by the client-side rate limiter")
+
+
+class LLMRateLimited(Exception):
+    """An LLM call that can't be served within its deadline under the rate limits"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# ------------------ Token Counting ------------------
+_encoder = None
+_encoder_loaded = False
+
+def _get_encoder():
+    """tiktoken encoder, or None if it can't be loaded (e.g. no network to fetch the BPE file)"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            logger.warning("tiktoken unavailable, estimating tokens as chars/4: %s", e)
+    return _encoder
+
+def warm_up():
+    """Load the tokenizer now; on a cold cache tiktoken downloads its BPE file (the app lifespan runs this in a thread)"""
+    _get_encoder()
+
+def count_tokens(text: str) -> int:
+    """Approximate token count (Llama tokenizes close to cl100k_base)"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    # ~4 tokens of chat framing per message plus the reply primer
+    return sum(count_tokens(m.get("content", "")) + 4 for m in messages) + 3
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens`, at a line break when one is close"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoder = _get_encoder()
+    if encoder is None:
+        cut = text[:max_tokens * 4]
+    else:
+        cut = encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return cut.rstrip() + "\n…"
+
+def fit_to_budget(texts: List[str], budget: int) -> List[str]:
+    """Trim texts so their tokens sum to at most `budget`.
+
+    Short texts keep everything; what they don't use is shared equally by
+    the longer ones (water-filling), so one long search result doesn't
+    crowd out the skills.
+    """
+    sizes = [count_tokens(text) for text in texts]
+    if sum(sizes) <= budget:
+        return list(texts)
+    allowance = [0] * len(texts)
+    remaining, pending = max(budget, 0), sorted(range(len(texts)), key=lambda i: sizes[i])
+    while pending:
+        share = remaining // len(pending)
+        i = pending.pop(0)
+        allowance[i] = min(sizes[i], share)
+        remaining -= allowance[i]
+    return [text if allowance[i] >= sizes[i] else trim_to_tokens(text, allowance[i])
+            for i, text in enumerate(texts)]
+
+
+# ------------------ Token Buckets ------------------
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute's worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.level = rate_per_minute
+        self.updated: Optional[float] = None
+
+    def _refill(self, now: float):
+        if self.updated is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, backlog: float = 0.0) -> float:
+        """Seconds until `amount` is available after `backlog` units queued ahead"""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        missing = backlog + amount - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.rate:
+            self._refill(now)
+            self.level -= amount
+
+    def refund(self, amount: float):
+        if self.rate:
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self):
+        """Empty the bucket (the server said we're over the limit)"""
+        if self.rate:
+            self.level = min(self.level, 0.0)
+
+
+# ------------------ Scheduler ------------------
+class _Waiter:
+    def __init__(self, tokens: int, deadline: Optional[float], future: asyncio.Future):
+        self.tokens = tokens
+        self.deadline = deadline
+        self.future = future
+
+
+class LLMScheduler:
+    """Client-side rate limiter in front of every LLM call.
+
+    Calls reserve one request and their estimated tokens (prompt plus
+    max_tokens) from two token buckets. Callers that can't go now wait in
+    a priority queue (then FIFO). A call that can't start before its
+    deadline, counting the calls queued ahead of it, is rejected at once
+    with LLMRateLimited instead of waiting only to fail.
+    """
+
+    def __init__(self, requests_per_minute: float = GROQ_RPM, tokens_per_minute: float = GROQ_TPM):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+        self.counters = {"granted": 0, "queued": 0, "rejected": 0, "server_rate_limited": 0, "wait_ms_total": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests.rate or self.tokens.rate)
+
+    def _backlog(self, priority: int):
+        """Requests and tokens queued at or above `priority`"""
+        waiting = [w for p, _, w in self._queue if p <= priority and not w.future.done()]
+        return len(waiting), sum(w.tokens for w in waiting)
+
+    def estimate_wait(self, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> float:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        queued_requests, queued_tokens = self._backlog(priority)
+        return max(
+            self._paused_until - now,
+            self.requests.wait_time(1, now, queued_requests),
+            self.tokens.wait_time(tokens, now, queued_tokens),
+        )
+
+    def _reject(self, message: str, retry_after: float):
+        self.counters["rejected"] += 1
+        REJECTED.inc()
+        raise LLMRateLimited(message, retry_after)
+
+    async def acquire(self, tokens: int, priority: Optional[int] = None, deadline: Optional[float] = None):
+        """Wait for a slot for a call of `tokens`; deadline is a loop.time() value"""
+        if not self.enabled:
+            return
+        priority = llm_priority.get() if priority is None else priority
+        loop = asyncio.get_running_loop()
+        if deadline is None:
+            max_wait = LLM_BATCH_MAX_QUEUE_WAIT if priority >= PRIORITY_BATCH else LLM_MAX_QUEUE_WAIT
+            deadline = loop.time() + max_wait
+            if llm_deadline.get() is not None:
+                deadline = min(deadline, llm_deadline.get())
+        if self.tokens.rate and tokens > self.tokens.capacity:
+            self._reject(f"LLM call of ~{tokens} tokens exceeds the {int(self.tokens.capacity)} tokens/min limit", 60.0)
+
+        wait = self.estimate_wait(tokens, priority)
+        if loop.time() + wait > deadline:
+            self._reject(f"LLM rate limit: no capacity for ~{wait:.0f}s", wait)
+
+        started = loop.time()
+        waiter = _Waiter(tokens, deadline, loop.create_future())
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self.counters["queued"] += 1
+        self._wake()
+        try:
+            await waiter.future
+        finally:
+            self.counters["wait_ms_total"] += (loop.time() - started) * 1000
+
+    def settle(self, reserved: int, used: Optional[int]):
+        """Return the unused part of a reservation once actual usage is known"""
+        if used is not None and used < reserved:
+            self.tokens.refund(reserved - used)
+
+    def server_rate_limited(self, retry_after: Optional[float]):
+        """The API returned 429: stop granting until it says we may retry"""
+        loop = asyncio.get_running_loop()
+        self.counters["server_rate_limited"] += 1
+        self.requests.drain()
+        self.tokens.drain()
+        self._paused_until = max(self._paused_until, loop.time() + (retry_after or 1.0))
+        self._wake()
+
+    def _wake(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            priority, seq, waiter = self._queue[0]
+            if waiter.future.done():  # caller cancelled
+                heapq.heappop(self._queue)
+                continue
+            now = loop.time()
+            wait = max(self._paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(waiter.tokens, now))
+            if wait <= 0:
+                heapq.heappop(self._queue)
+                self.requests.take(1, now)
+                self.tokens.take(waiter.tokens, now)
+                self.counters["granted"] += 1
+                waiter.future.set_result(None)
+                continue
+            if waiter.deadline is not None and now + wait > waiter.deadline:
+                heapq.heappop(self._queue)
+                self.counters["rejected"] += 1
+                REJECTED.inc()
+                waiter.future.set_exception(LLMRateLimited(f"LLM rate limit: no capacity for ~{wait:.0f}s", wait))
+                continue
+            # Sleep until the head can go, or until a new (maybe higher priority) caller arrives
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        granted = self.counters["granted"]
+        return {
+            "requests_per_minute": self.requests.capacity,
+            "tokens_per_minute": self.tokens.capacity,
+            "queued_now": sum(1 for _, _, w in self._queue if not w.future.done()),
+            **{k: v for k, v in self.counters.items() if k != "wait_ms_total"},
+            "avg_wait_ms": round(self.counters["wait_ms_total"] / granted, 3) if granted else 0.0,
+        }
@@ -0,0 +1,554 @@
+import os
+import sys
+import time
+import asyncio
+from datetime import timedelta
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+import anyio
+import httpx
+from mcp.client.session import ClientSession
+from mcp.client.stdio import stdio_client, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from telemetry import get_logger, span
+
+logger = get_logger("mcp_pool")
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", "30"))
+MCP_START_TIMEOUT = float(os.getenv("MCP_START_TIMEOUT", "20"))
+MCP_CHECKOUT_TIMEOUT = float(os.getenv("MCP_CHECKOUT_TIMEOUT", "30"))
+MCP_PING_TIMEOUT = float(os.getenv("MCP_PING_TIMEOUT", "5"))
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "30"))
+
+# Per-server transport: MCP_<NAME>_TRANSPORT=stdio|http|sse and, for the
+# network transports, MCP_<NAME>_URLS=comma-separated endpoints
+TRANSPORTS = ("stdio", "http", "sse")
+
+# Errors that mean the connection is broken, not just the request (an McpError,
+# e.g. a read timeout, is an answer about one request on a working session)
+TRANSPORT_ERRORS = (OSError, httpx.TransportError, anyio.ClosedResourceError, anyio.BrokenResourceError,
+                    anyio.EndOfStream)
+
+
+# ------------------ Pooled Session ------------------
+class PooledSession:
+    """One MCP connection (a server process or a network endpoint) with an initialized ClientSession.
+
+    The transport and session are anyio contexts that must be entered and
+    exited by the same task, so each session lives inside its own
+    background task until close() is called.
+    """
+
+    def __init__(self, server_name: str, connect: Callable[[], Any], span_name: str = "mcp.spawn"):
+        self.server_name = server_name
+        self.connect = connect
+        self.span_name = span_name
+        self.session: Optional[ClientSession] = None
+        self.error: Optional[BaseException] = None
+        self.last_used = time.monotonic()
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, timeout: float = MCP_START_TIMEOUT):
+        """Open the transport and wait for the MCP handshake"""
+        with span(self.span_name, server=self.server_name):
+            self._task = asyncio.create_task(self._run())
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                await self.close()
+                raise RuntimeError(f"{self.server_name} server did not initialize within {timeout}s")
+            if self.session is None:
+                raise RuntimeError(f"{self.server_name} server failed to start: {self.error}")
+
+    async def _run(self):
+        try:
+            async with self.connect() as streams:
+                read_stream, write_stream = streams[0], streams[1]
+                async with ClientSession(read_stream, write_stream) as session:
+                    with span("mcp.initialize", server=self.server_name):
+                        await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def ping(self, timeout: float = MCP_PING_TIMEOUT) -> bool:
+        """Health check the server with an MCP ping"""
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        """Shut down the session and its transport"""
+        self._closing.set()
+        if self._task is None or self._task.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), 5)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+
+# ------------------ Per-Server Pool (stdio) ------------------
+class _ServerPool:
+    """Fixed-size set of warm sessions for one MCP server script.
+
+    A stdio session serves one call at a time, so sessions are checked out
+    exclusively and returned to the idle queue afterwards.
+    """
+
+    transport = "stdio"
+    failover_attempts = 1
+
+    def __init__(self, name: str, script: str, size: int, health_interval: float = MCP_HEALTH_INTERVAL):
+        self.name = name
+        self.size = size
+        self.health_interval = health_interval
+        self.params = StdioServerParameters(
+            command=sys.executable,
+            args=[script],
+            env=dict(os.environ),
+            cwd=PROJECT_ROOT,
+        )
+        self.idle: asyncio.Queue = asyncio.Queue()
+        self.sessions = set()
+        self.respawning = set()
+        self.waiting = 0
+        self.counters = {
+            "spawned": 0,
+            "spawn_failures": 0,
+            "respawns": 0,
+            "health_check_failures": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+            "call_errors": 0,
+            "failovers": 0,
+            "checkout_wait_ms_total": 0.0,
+        }
+
+    async def spawn(self) -> PooledSession:
+        pooled = PooledSession(self.name, lambda: stdio_client(self.params))
+        try:
+            await pooled.start()
+        except Exception:
+            self.counters["spawn_failures"] += 1
+            raise
+        self.counters["spawned"] += 1
+        self.sessions.add(pooled)
+        return pooled
+
+    async def start(self):
+        results = await asyncio.gather(*(self.spawn() for _ in range(self.size)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, PooledSession):
+                self.idle.put_nowait(result)
+            else:
+                logger.error("Could not start %s server: %s", self.name, result)
+                self.schedule_respawn()
+        logger.info("%s: %d/%d sessions warm", self.name, self.idle.qsize(), self.size)
+
+    async def close(self):
+        for task in list(self.respawning):
+            task.cancel()
+        await asyncio.gather(*(pooled.close() for pooled in list(self.sessions)), return_exceptions=True)
+        self.sessions.clear()
+        self.idle = asyncio.Queue()
+
+    async def _respawn_loop(self):
+        delay = 0.5
+        while True:
+            try:
+                pooled = await self.spawn()
+                self.idle.put_nowait(pooled)
+                logger.info("Respawned %s server", self.name)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Respawn of %s failed, retrying in %.1fs: %s", self.name, delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def schedule_respawn(self):
+        """Start a replacement session in the background"""
+        task = asyncio.create_task(self._respawn_loop())
+        self.respawning.add(task)
+        task.add_done_callback(self.respawning.discard)
+
+    def replace(self, pooled: PooledSession):
+        """Drop a dead session and respawn it"""
+        self.sessions.discard(pooled)
+        asyncio.create_task(pooled.close())
+        self.counters["respawns"] += 1
+        self.schedule_respawn()
+
+    async def check_health(self):
+        # Only sessions idle right now are checked; busy ones get checked on return
+        for _ in range(self.idle.qsize()):
+            try:
+                pooled = self.idle.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if await pooled.ping():
+                self.idle.put_nowait(pooled)
+            else:
+                self.counters["health_check_failures"] += 1
+                logger.warning("%s session failed health check, respawning", self.name)
+                self.replace(pooled)
+
+    async def checkout(self, timeout: float) -> PooledSession:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.counters["checkout_timeouts"] += 1
+                raise TimeoutError(f"No {self.name} MCP session available within {timeout}s")
+            try:
+                pooled = await asyncio.wait_for(self.idle.get(), remaining)
+            except asyncio.TimeoutError:
+                continue
+            stale = time.monotonic() - pooled.last_used > self.health_interval
+            if pooled.alive and (not stale or await pooled.ping()):
+                return pooled
+            self.counters["health_check_failures"] += 1
+            self.replace(pooled)
+
+    def has_idle(self) -> bool:
+        """Whether a checkout right now would not have to wait"""
+        return self.idle.qsize() > 0
+
+    def release(self, pooled: PooledSession):
+        pooled.last_used = time.monotonic()
+        if pooled.alive:
+            self.idle.put_nowait(pooled)
+        else:
+            self.replace(pooled)
+
+    def fail(self, pooled: PooledSession, error: Exception):
+        # The server may be wedged mid-request; don't hand it to anyone else
+        self.counters["call_errors"] += 1
+        self.replace(pooled)
+
+    def stats(self) -> dict:
+        checkouts = self.counters["checkouts"]
+        in_use = len(self.sessions) - self.idle.qsize()
+        return {
+            "transport": self.transport,
+            "size": self.size,
+            "live": len(self.sessions),
+            "idle": self.idle.qsize(),
+            "in_use": max(in_use, 0),
+            "waiting": self.waiting,
+            "respawning": len(self.respawning),
+            **{k: v for k, v in self.counters.items() if k != "checkout_wait_ms_total"},
+            "avg_checkout_wait_ms": round(self.counters["checkout_wait_ms_total"] / checkouts, 3) if checkouts else 0.0,
+        }
+
+
+# ------------------ Per-Server Pool (network) ------------------
+class _RemotePool:
+    """Shared sessions to an MCP server deployed as a network service.
+
+    An MCP session multiplexes concurrent requests over one connection, so
+    each endpoint gets a single long-lived session that every request
+    shares. Calls go round-robin to live endpoints. An endpoint whose
+    transport fails, or that fails a ping, is reconnected in the background
+    while the others take its traffic; a call that fails on a working
+    session (e.g. it timed out) only fails over to the next endpoint.
+    """
+
+    def __init__(self, name: str, transport: str, urls: List[str], health_interval: float = MCP_HEALTH_INTERVAL):
+        if not urls:
+            raise ValueError(f"MCP server '{name}' uses the {transport} transport but has no URLs")
+        self.name = name
+        self.transport = transport
+        self.urls = list(urls)
+        self.size = len(self.urls)
+        self.failover_attempts = len(self.urls)
+        self.health_interval = health_interval
+        self.endpoints: Dict[str, Optional[PooledSession]] = {url: None for url in self.urls}
+        self.reconnecting: Dict[str, asyncio.Task] = {}
+        self.checking: Dict[PooledSession, asyncio.Task] = {}
+        self.in_use = 0
+        self.waiting = 0
+        self._cursor = 0
+        self.counters = {
+            "connects": 0,
+            "connect_failures": 0,
+            "reconnects": 0,
+            "health_check_failures": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+            "call_errors": 0,
+            "failovers": 0,
+            "checkout_wait_ms_total": 0.0,
+        }
+
+    def _client(self, url: str):
+        if self.transport == "sse":
+            return lambda: sse_client(url)
+        return lambda: streamablehttp_client(url)
+
+    async def connect(self, url: str) -> PooledSession:
+        pooled = PooledSession(self.name, self._client(url), span_name="mcp.connect")
+        try:
+            await pooled.start()
+        except Exception:
+            self.counters["connect_failures"] += 1
+            raise
+        self.counters["connects"] += 1
+        self.endpoints[url] = pooled
+        return pooled
+
+    async def start(self):
+        results = await asyncio.gather(*(self.connect(url) for url in self.urls), return_exceptions=True)
+        for url, result in zip(self.urls, results):
+            if not isinstance(result, PooledSession):
+                logger.error("Could not connect to %s server at %s: %s", self.name, url, result)
+                self.schedule_reconnect(url)
+        live = sum(1 for pooled in self.endpoints.values() if pooled is not None)
+        logger.info("%s: %d/%d %s endpoints connected", self.name, live, self.size, self.transport)
+
+    async def close(self):
+        for task in [*self.reconnecting.values(), *self.checking.values()]:
+            task.cancel()
+        self.reconnecting.clear()
+        await asyncio.gather(
+            *(pooled.close() for pooled in self.endpoints.values() if pooled is not None), return_exceptions=True
+        )
+        self.endpoints = {url: None for url in self.urls}
+
+    async def _reconnect_loop(self, url: str):
+        delay = 0.5
+        try:
+            while True:
+                try:
+                    await self.connect(url)
+                    logger.info("Reconnected to %s server at %s", self.name, url)
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Reconnect to %s at %s failed, retrying in %.1fs: %s", self.name, url, delay, e)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30)
+        finally:
+            self.reconnecting.pop(url, None)
+
+    def schedule_reconnect(self, url: str):
+        if url not in self.reconnecting:
+            self.reconnecting[url] = asyncio.create_task(self._reconnect_loop(url))
+
+    def _mark_down(self, pooled: PooledSession):
+        for url, current in self.endpoints.items():
+            if current is pooled:
+                self.endpoints[url] = None
+                asyncio.create_task(pooled.close())
+                self.counters["reconnects"] += 1
+                self.schedule_reconnect(url)
+                return
+
+    async def check_health(self):
+        for pooled in [p for p in self.endpoints.values() if p is not None]:
+            if not await pooled.ping():
+                self.counters["health_check_failures"] += 1
+                logger.warning("%s endpoint failed health check, reconnecting", self.name)
+                self._mark_down(pooled)
+
+    async def checkout(self, timeout: float) -> PooledSession:
+        deadline = time.monotonic() + timeout
+        while True:
+            for pooled in [p for p in self.endpoints.values() if p is not None and not p.alive]:
+                self._mark_down(pooled)
+            live = [p for p in self.endpoints.values() if p is not None]
+            if live:
+                pooled = live[self._cursor % len(live)]
+                self._cursor += 1
+                self.in_use += 1
+                return pooled
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.counters["checkout_timeouts"] += 1
+                raise TimeoutError(f"No {self.name} MCP endpoint reachable within {timeout}s")
+            await asyncio.sleep(min(0.1, remaining))
+
+    def has_idle(self) -> bool:
+        # Sessions are shared, so any live endpoint can take another call
+        return any(pooled is not None for pooled in self.endpoints.values())
+
+    def release(self, pooled: PooledSession):
+        self.in_use -= 1
+        pooled.last_used = time.monotonic()
+
+    def fail(self, pooled: PooledSession, error: Exception):
+        """A call failed: reconnect on a transport error, else keep the shared session if it still answers pings"""
+        self.in_use -= 1
+        self.counters["call_errors"] += 1
+        if not pooled.alive or isinstance(error, TRANSPORT_ERRORS):
+            self._mark_down(pooled)
+        elif pooled not in self.checking:
+            # Other requests are using the session; only a failed ping takes it out
+            task = asyncio.create_task(self._check(pooled))
+            self.checking[pooled] = task
+            task.add_done_callback(lambda _: self.checking.pop(pooled, None))
+
+    async def _check(self, pooled: PooledSession):
+        if not await pooled.ping():
+            self.counters["health_check_failures"] += 1
+            logger.warning("%s endpoint failed a ping after a call error, reconnecting", self.name)
+            self._mark_down(pooled)
+
+    def stats(self) -> dict:
+        checkouts = self.counters["checkouts"]
+        return {
+            "transport": self.transport,
+            "size": self.size,
+            "live": sum(1 for pooled in self.endpoints.values() if pooled is not None),
+            "endpoints": {url: pooled is not None for url, pooled in self.endpoints.items()},
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "respawning": len(self.reconnecting),
+            **{k: v for k, v in self.counters.items() if k != "checkout_wait_ms_total"},
+            "avg_checkout_wait_ms": round(self.counters["checkout_wait_ms_total"] / checkouts, 3) if checkouts else 0.0,
+        }
+
+
+# ------------------ Session Pool ------------------
+class MCPSessionPool:
+    """Warm, long-lived MCP sessions shared by all requests.
+
+    Servers are spawned (stdio) or connected to (http/sse) once, at app
+    startup or lazily on first use. Sessions are checked out for the
+    duration of a tool call and returned afterwards. Sessions that fail a
+    call or a health check are replaced.
+    """
+
+    def __init__(self, size: int = MCP_POOL_SIZE, health_interval: float = MCP_HEALTH_INTERVAL):
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        self._servers: Dict[str, Any] = {}
+        self._started = False
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, script: str, transport: Optional[str] = None, urls: Optional[List[str]] = None):
+        """Register an MCP server.
+
+        `script` is the stdio server (relative to the project root). The
+        transport and URLs default to MCP_<NAME>_TRANSPORT and
+        MCP_<NAME>_URLS, so one tool can move to a network service without
+        code changes.
+        """
+        prefix = f"MCP_{name.upper()}"
+        transport = transport or os.getenv(f"{prefix}_TRANSPORT", "stdio")
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown MCP transport '{transport}' for {name} (expected one of {TRANSPORTS})")
+        if transport == "stdio":
+            self._servers[name] = _ServerPool(name, script, self.size, self.health_interval)
+        else:
+            if urls is None:
+                urls = [url.strip() for url in os.getenv(f"{prefix}_URLS", "").split(",") if url.strip()]
+            self._servers[name] = _RemotePool(name, transport, urls, self.health_interval)
+
+    async def start(self):
+        """Spawn or connect every registered server"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            for server in self._servers.values():
+                await server.start()
+            if self.health_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop())
+            self._started = True
+
+    async def close(self):
+        """Terminate every pooled server process and connection"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for server in self._servers.values():
+            await server.close()
+        self._started = False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for server in self._servers.values():
+                await server.check_health()
+
+    @asynccontextmanager
+    async def session(self, name: str, timeout: float = MCP_CHECKOUT_TIMEOUT):
+        """Check out a warm ClientSession for `name` and return it on exit"""
+        if not self._started:
+            await self.start()
+        server = self._servers[name]
+        started = time.monotonic()
+        server.waiting += 1
+        try:
+            with span("mcp.checkout", server=name):
+                pooled = await server.checkout(timeout)
+        finally:
+            server.waiting -= 1
+        server.counters["checkouts"] += 1
+        server.counters["checkout_wait_ms_total"] += (time.monotonic() - started) * 1000
+
+        try:
+            yield pooled.session
+        except asyncio.CancelledError:
+            # A late response to a cancelled request is dropped by the session
+            server.release(pooled)
+            raise
+        except Exception as e:
+            server.fail(pooled, e)
+            raise
+        else:
+            server.release(pooled)
+
+    async def call_tool(self, name: str, tool: str, arguments: Dict[str, Any], timeout: float = MCP_CALL_TIMEOUT):
+        """Call `tool` on server `name`, failing over to other endpoints if a call fails"""
+        server = self._servers[name]
+        for attempt in range(server.failover_attempts):
+            try:
+                async with self.session(name) as session:
+                    return await session.call_tool(
+                        tool, arguments=arguments, read_timeout_seconds=timedelta(seconds=timeout)
+                    )
+            except TimeoutError:
+                raise  # no endpoint could be checked out; trying again would wait twice
+            except Exception as e:
+                if attempt + 1 >= server.failover_attempts:
+                    raise
+                server.counters["failovers"] += 1
+                logger.warning("%s call to %s failed, failing over: %s", tool, name, e)
+
+    def has_idle(self, name: str) -> bool:
+        """Whether server `name` can take a call right now without queueing"""
+        return self._started and self._servers[name].has_idle()
+
+    def stats(self) -> dict:
+        """Pool sizing stats per server"""
+        return {
+            "started": self._started,
+            "pool_size": self.size,
+            "servers": {name: server.stats() for name, server in self._servers.items()},
+        }
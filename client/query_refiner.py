@@ -0,0 +1,157 @@
+import os
+import re
+from typing import List, Tuple
+from client.llm_client import get_llm_client
+from local_rag import STOP_WORDS, TOKEN_RE, get_vocabulary
+from telemetry import get_logger, span
+
+logger = get_logger("query_refiner")
+
+# "llm" (Groq rewrites every query), "local" (deterministic, no LLM call) or
+# "hybrid" (local, escalating queries it isn't confident about to the LLM)
+REFINER_MODE = os.getenv("REFINER_MODE", "hybrid")
+# Share of a query's content words that must be recognized to skip the LLM
+REFINER_MIN_CONFIDENCE = float(os.getenv("REFINER_MIN_CONFIDENCE", "0.6"))
+# Longer queries are usually rambling and go to the LLM in hybrid mode
+REFINER_MAX_LOCAL_TERMS = int(os.getenv("REFINER_MAX_LOCAL_TERMS", "12"))
+
+# Words that carry no intent in a career question
+FILLER_WORDS = frozenset("""
+um uh hmm hey hi hello please thanks thank just really basically actually like kinda sorta maybe
+anyway ok okay well guess wondering tell know stuff thing things something
+""".split())
+FILLER_PHRASES = re.compile(
+    r"\b(i was wondering|can you tell me|could you tell me|i would like to know|you know|i guess|kind of|sort of)\b",
+    re.IGNORECASE,
+)
+# Clear career-question words that are not in the CV index
+CAREER_TERMS = frozenset("""
+skill skills career careers job jobs role roles learn learning course courses certification certifications
+interview interviews resume cv salary promotion experience improve become developer engineer transition
+switch next roadmap path gap gaps advice recommend recommendations strengths weaknesses
+""".split())
+# References that only make sense with context the refiner doesn't have
+VAGUE_REFERENCES = frozenset("it that this those these they them one".split())
+
+
+# ------------------ LLM Refiner ------------------
+class QueryRefinerPlugin:
+    name = "llm"
+
+    def __init__(self):
+        self.client = get_llm_client()
+
+    async def refine_query(self, query: str) -> str:
+        with span("refine", strategy=self.name) as refine_span:
+            try:
+                return await self._refine(query)
+            except Exception as e:
+                refine_span.outcome = "fallback"
+                fallback = f"Refined intent from user: {query.strip().capitalize()}."
+                logger.warning("[QueryRefinerPlugin] Fallback due to error: %s", e)
+                return fallback
+
+    async def _refine(self, query: str) -> str:
+        prompt = f"""
+        You are a smart assistant that refines casual or vague user queries into clear, structured intent statements.
+        Rephrase the input for clarity and remove filler words.
+
+        Original Query: "{query.strip()}"
+        Refined Intent:"""
+
+        refined_query = await self.client.chat(
+            messages=[
+                {"role": "system", "content": "You are a query refiner that restructures raw user questions into clean, intent-focused queries."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=60
+        )
+        logger.debug("[QueryRefinerPlugin] Refined: %s", refined_query)
+        return refined_query
+
+
+# ------------------ Local Refiner ------------------
+def _has_term(term: str) -> bool:
+    """Whether the skills index knows `term` or its singular (loaded by the app lifespan)"""
+    try:
+        vocabulary = get_vocabulary()
+    except Exception as e:
+        logger.warning("Skills index unavailable to the local refiner: %s", e)
+        return False
+    return vocabulary.has_term(term) or (term.endswith("s") and vocabulary.has_term(term[:-1]))
+
+def warm_up():
+    """Load the vocabulary _has_term() reads now (the app lifespan runs this in a thread)"""
+    _has_term("")
+
+class LocalRefiner:
+    """Deterministic refiner: strips filler and scores confidence from the index keywords it recognizes.
+
+    Confidence is the share of the query's content words (not stop or
+    filler words) that are skills-index terms or common career words. A
+    query with no recognized word, only a vague reference ("what about
+    that?") or too many words scores low.
+    """
+
+    name = "local"
+
+    def analyze(self, query: str) -> Tuple[str, float, List[str]]:
+        """(refined query, confidence in [0, 1], skills-index keywords found).
+
+        The refined query is the cleaned sentence alone: it goes verbatim
+        into the web search and the final prompt.
+        """
+        words = TOKEN_RE.findall(query.lower())
+        content = [w for w in words if w not in STOP_WORDS and w not in FILLER_WORDS]
+        keywords: List[str] = []
+        for word in content:
+            if word not in keywords and _has_term(word):
+                keywords.append(word)
+        known = [w for w in content if w in keywords or w in CAREER_TERMS]
+
+        confidence = len(known) / len(content) if content else 0.0
+        if len(content) <= 2 and VAGUE_REFERENCES.intersection(words):
+            confidence /= 2
+        if len(content) > REFINER_MAX_LOCAL_TERMS:
+            confidence /= 2
+
+        sentence = FILLER_PHRASES.sub(" ", query)
+        sentence = " ".join(w for w in sentence.split() if w.lower().strip(",.!?") not in FILLER_WORDS)
+        sentence = sentence.strip(" ,.!?") or query.strip()
+        sentence = sentence[:1].upper() + sentence[1:] + ("?" if query.rstrip().endswith("?") else ".")
+        return sentence, confidence, keywords
+
+    async def refine_query(self, query: str) -> str:
+        with span("refine", strategy=self.name):
+            refined, confidence, keywords = self.analyze(query)
+        logger.debug("[LocalRefiner] Refined (confidence %.2f, keywords %s): %s", confidence, keywords, refined)
+        return refined
+
+
+class HybridRefiner:
+    """Local refinement for clear queries; ambiguous ones go to the LLM refiner"""
+
+    name = "hybrid"
+
+    def __init__(self, min_confidence: float = REFINER_MIN_CONFIDENCE):
+        self.local = LocalRefiner()
+        self.min_confidence = min_confidence
+
+    async def refine_query(self, query: str) -> str:
+        with span("refine", strategy=self.local.name) as local_span:
+            refined, confidence, keywords = self.local.analyze(query)
+            if confidence < self.min_confidence:
+                local_span.outcome = "escalated"
+        if confidence >= self.min_confidence:
+            return refined
+        return await QueryRefinerPlugin().refine_query(query)
+
+
+REFINERS = {"llm": QueryRefinerPlugin, "local": LocalRefiner, "hybrid": HybridRefiner}
+
+def create_refiner(mode: str = REFINER_MODE):
+    """A query refiner by name ("llm", "local" or "hybrid")"""
+    if mode not in REFINERS:
+        raise ValueError(f"Unknown REFINER_MODE '{mode}', expected one of {sorted(REFINERS)}")
+    return REFINERS[mode]()
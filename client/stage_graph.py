@@ -0,0 +1,216 @@
+import time
+import asyncio
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from telemetry import counter, get_logger
+
+logger = get_logger("stage_graph")
+
+STAGES_SKIPPED = counter("agent_stage_skipped_total", "Stages replaced by their fallback value")
+
+
+# ------------------ Stage Graph ------------------
+class StageTimeout(TimeoutError):
+    """A stage without a fallback ran out of time"""
+
+
+class Stage:
+    """A named async step and the names of the values it consumes.
+
+    The stage's return value is published under its own name, so other
+    stages can list it as an input. Inputs are passed as keyword arguments.
+    A stage with a `fallback` is optional: if it times out or fails,
+    fallback(**inputs) is published instead and the run carries on.
+    """
+
+    def __init__(self, name: str, func: Callable[..., Awaitable[Any]], inputs: Iterable[str] = (),
+                 timeout: Optional[float] = None, fallback: Optional[Callable[..., Any]] = None,
+                 semaphore: Optional[asyncio.Semaphore] = None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.timeout = timeout
+        self.fallback = fallback
+        self.semaphore = semaphore
+
+
+class GraphRun:
+    """Values and per-stage timings produced by one StageGraph.run()"""
+
+    def __init__(self, values: Dict[str, Any]):
+        self.values = values
+        self.timings: Dict[str, float] = {}
+        self.skipped: Dict[str, str] = {}  # stage -> "deadline", "timeout" or "error"
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+
+class StageGraph:
+    """Runs async stages as soon as their inputs are available.
+
+    Independent stages run concurrently, so end-to-end latency is the
+    longest path through the graph rather than the sum of every stage.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], inputs: Iterable[str] = (),
+            timeout: Optional[float] = None, fallback: Optional[Callable[..., Any]] = None) -> "StageGraph":
+        """Register a stage; its result is available to later stages as `name`"""
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        self.stages[name] = Stage(name, func, inputs, timeout, fallback)
+        return self
+
+    def _copy(self, stage: Stage, **changes) -> Stage:
+        fields = dict(func=stage.func, inputs=stage.inputs, timeout=stage.timeout,
+                      fallback=stage.fallback, semaphore=stage.semaphore)
+        fields.update(changes)
+        return Stage(stage.name, **fields)
+
+    def subgraph(self, *targets: str) -> "StageGraph":
+        """A graph with only `targets` and the stages they depend on"""
+        graph = StageGraph()
+        needed, pending = set(), list(targets)
+        while pending:
+            name = pending.pop()
+            if name in self.stages and name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].inputs)
+        for name, stage in self.stages.items():
+            if name in needed:
+                graph.stages[name] = self._copy(stage)
+        return graph
+
+    def bounded(self, limits: Dict[str, asyncio.Semaphore]) -> "StageGraph":
+        """A copy of the graph where each stage named in `limits` runs under its semaphore.
+
+        A stage's timeout starts once it holds its semaphore, so waiting
+        for a slot doesn't use up its budget (the run deadline still counts).
+        """
+        graph = StageGraph()
+        for name, stage in self.stages.items():
+            graph.stages[name] = self._copy(stage, semaphore=limits.get(name, stage.semaphore))
+        return graph
+
+    def without_timeouts(self, *names: str) -> "StageGraph":
+        """A copy of the graph where the stages `names` have no timeout of their own"""
+        graph = StageGraph()
+        for name, stage in self.stages.items():
+            graph.stages[name] = self._copy(stage, timeout=None) if name in names else self._copy(stage)
+        return graph
+
+    def reserves(self) -> Dict[str, float]:
+        """Per stage, the summed timeouts of the longest chain of stages that depend on it"""
+        dependents: Dict[str, List[str]] = {name: [] for name in self.stages}
+        for stage in self.stages.values():
+            for name in stage.inputs:
+                if name in dependents:
+                    dependents[name].append(stage.name)
+        external = {name for stage in self.stages.values() for name in stage.inputs if name not in self.stages}
+        reserves: Dict[str, float] = {}
+        for name in reversed(self.order(external)):
+            reserves[name] = max(
+                ((self.stages[d].timeout or 0.0) + reserves[d] for d in dependents[name]), default=0.0
+            )
+        return reserves
+
+    def order(self, provided: Iterable[str] = ()) -> List[str]:
+        """Topological order of the stages not already provided; raises on unknown inputs or cycles"""
+        available = set(provided)
+        remaining = {name: stage for name, stage in self.stages.items() if name not in available}
+        ordered = []
+        while remaining:
+            ready = [name for name, stage in remaining.items() if all(i in available for i in stage.inputs)]
+            if not ready:
+                missing = {i for s in remaining.values() for i in s.inputs if i not in available and i not in remaining}
+                if missing:
+                    raise ValueError(f"Stage inputs are not provided: {sorted(missing)}")
+                raise ValueError(f"Stage graph has a cycle between: {sorted(remaining)}")
+            for name in ready:
+                ordered.append(name)
+                available.add(name)
+                del remaining[name]
+        return ordered
+
+    async def run(self, on_stage_done: Optional[Callable[[str, Any], None]] = None,
+                  deadline: Optional[float] = None, **inputs: Any) -> GraphRun:
+        """Run every stage and return all values, inputs included.
+
+        A stage whose value is passed in as an input is skipped, so callers
+        can supply results they already have. `on_stage_done(name, value)`
+        is called as each stage finishes.
+
+        `deadline` (a loop.time() value) is split between the stages: each
+        one must finish early enough to leave its dependents their
+        timeouts. Stages that overrun are cancelled. Optional stages then
+        publish their fallback (see GraphRun.skipped), and a required
+        stage raises StageTimeout.
+        """
+        self.order(inputs)
+        reserves = self.reserves() if deadline is not None else {}
+        loop = asyncio.get_running_loop()
+        run = GraphRun(dict(inputs))
+        futures: Dict[str, asyncio.Future] = {name: loop.create_future() for name in self.stages}
+        for name, value in inputs.items():
+            futures.setdefault(name, loop.create_future()).set_result(value)
+
+        def skip(stage: Stage, kwargs: Dict[str, Any], reason: str):
+            run.skipped[stage.name] = reason
+            STAGES_SKIPPED.inc(stage=stage.name, reason=reason)
+            return stage.fallback(**kwargs)
+
+        def time_limit(stage: Stage) -> Optional[float]:
+            limit = stage.timeout
+            if deadline is not None:
+                remaining = deadline - loop.time() - reserves.get(stage.name, 0.0)
+                if remaining <= 0 and stage.fallback is None:
+                    # A required stage gets whatever is left before the deadline itself
+                    remaining = deadline - loop.time()
+                limit = remaining if limit is None else min(limit, remaining)
+            return limit
+
+        async def call_stage(stage: Stage, kwargs: Dict[str, Any]):
+            limit = time_limit(stage)
+            if limit is not None and limit <= 0:
+                if stage.fallback is not None:
+                    return skip(stage, kwargs, "deadline")
+                raise StageTimeout(f"Stage '{stage.name}' has no time left before the deadline")
+            try:
+                return await asyncio.wait_for(stage.func(**kwargs), limit)
+            except asyncio.TimeoutError:
+                if stage.fallback is not None:
+                    return skip(stage, kwargs, "timeout")
+                raise StageTimeout(f"Stage '{stage.name}' timed out after {limit:.1f}s") from None
+            except Exception as e:
+                if stage.fallback is None:
+                    raise
+                logger.warning("Stage %s failed, using its fallback: %s", stage.name, e)
+                return skip(stage, kwargs, "error")
+
+        async def run_stage(stage: Stage):
+            kwargs = {name: await futures[name] for name in stage.inputs}
+            async with stage.semaphore or nullcontext():
+                started = time.perf_counter()
+                try:
+                    value = await call_stage(stage, kwargs)
+                finally:
+                    run.timings[stage.name] = time.perf_counter() - started
+            run.values[stage.name] = value
+            futures[stage.name].set_result(value)
+            if on_stage_done is not None:
+                on_stage_done(stage.name, value)
+
+        tasks = [asyncio.create_task(run_stage(stage)) for stage in self.stages.values() if stage.name not in inputs]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for future in futures.values():
+                if not future.done():
+                    future.cancel()
+        return run
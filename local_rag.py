@@ -1,106 +1,424 @@
 import os
 import re
-from typing import List, Dict
+import sys
+import math
+import heapq
+import zlib
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # only the vector backend needs numpy
+    np = None
+
+TOKEN_RE = re.compile(r'\b\w+\b')
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: case, spacing and trailing punctuation don't matter.
+
+    Shared by the client's stage caches and the search servers' result cache.
+    """
+    return re.sub(r"\s+", " ", text.lower()).strip().rstrip("?!. ")
+
+# Common words that never identify a skill; kept out of the index and queries
+STOP_WORDS = frozenset("""
+a an and are as at be been but by can could do does for from have has how i if in into is it its
+me my of on or our should so than that the their them then there these this to was we what when
+where which who why will with would you your
+""".split())
+
+# BM25 parameters; a tagged keyword counts as KEYWORD_WEIGHT mentions in the text
+BM25_K1 = 1.2
+BM25_B = 0.75
+KEYWORD_WEIGHT = 2.0
+
+# Retrieval backend for the global rag_system: "keyword" (BM25) or "vector"
+RAG_BACKEND = os.getenv("RAG_BACKEND", "keyword")
+# Hashed feature space of the vector backend; the matrix takes docs * dim * 4 bytes
+VECTOR_DIM = int(os.getenv("RAG_VECTOR_DIM", "512"))
+# Character n-grams give the vector backend partial matches ("program" ~ "programming")
+CHAR_NGRAM = 3
+CHAR_NGRAM_WEIGHT = 0.5
+MIN_SIMILARITY = 0.1
+# Rows gathered at a time when scoring a query's columns; a 4096-row block
+# of its ~30 columns stays in cache for the product instead of being
+# written out and read back as one large copy
+SCORE_BLOCK_ROWS = 4096
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words"""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+def get_sample_skills() -> List[Dict[str, str]]:
+    """Sample CV skills data"""
+    return [
+        {
+            "id": "programming",
+            "content": "Python programming with 3 years experience in web development, FastAPI, Django",
+            "keywords": ["python", "web", "development", "fastapi", "django", "programming"]
+        },
+        {
+            "id": "ml",
+            "content": "Machine learning expertise using scikit-learn and TensorFlow for data science",
+            "keywords": ["machine", "learning", "ml", "ai", "tensorflow", "scikit", "data", "science"]
+        },
+        {
+            "id": "data_analysis",
+            "content": "Data analysis with pandas and numpy for business intelligence and reporting",
+            "keywords": ["data", "analysis", "pandas", "numpy", "business", "intelligence", "reporting"]
+        },
+        {
+            "id": "databases",
+            "content": "SQL database design and optimization for large datasets and performance tuning",
+            "keywords": ["sql", "database", "optimization", "performance", "datasets"]
+        },
+        {
+            "id": "frontend",
+            "content": "React.js frontend development with modern JavaScript and responsive design",
+            "keywords": ["react", "frontend", "javascript", "ui", "responsive", "design"]
+        },
+        {
+            "id": "apis",
+            "content": "RESTful API development using FastAPI and Django for microservices",
+            "keywords": ["api", "rest", "fastapi", "django", "microservices", "backend"]
+        },
+        {
+            "id": "cloud",
+            "content": "Cloud deployment experience with AWS, Docker containers and DevOps",
+            "keywords": ["cloud", "aws", "docker", "devops", "deployment", "containers"]
+        },
+        {
+            "id": "management",
+            "content": "Project management skills with Agile methodologies and team leadership",
+            "keywords": ["project", "management", "agile", "leadership", "team", "scrum"]
+        }
+    ]
+
+def documents_bytes(documents: List[Dict[str, str]]) -> int:
+    """Approximate memory held by document dicts, their strings and keyword lists"""
+    total = sys.getsizeof(documents)
+    for doc in documents:
+        total += sys.getsizeof(doc)
+        for value in doc.values():
+            total += sys.getsizeof(value)
+            if isinstance(value, (list, tuple)):
+                total += sum(sys.getsizeof(item) for item in value)
+    return total
+
+def strings_bytes(strings) -> int:
+    """Approximate memory of a dict or set of strings, keys only"""
+    return sys.getsizeof(strings) + sum(sys.getsizeof(s) for s in strings)
+
+# One posting: a list slot and the (doc_idx, tf) tuple; a document's id is
+# one int shared by all its postings, and most tfs are small cached ints
+POSTING_BYTES = 8 + sys.getsizeof((0, 0))
+
+def format_skills(docs: List[Dict[str, str]]) -> str:
+    """Format matched documents the way the MCP tools return them"""
+    if not docs:
+        return "No relevant skills found in the CV for your query."
+    formatted_skills = "\n".join([f"• {doc['content']}" for doc in docs])
+    return f"Current skills found in CV:\n{formatted_skills}"
 
 class SimpleRAG:
-    """Simple keyword-based RAG system without heavy dependencies"""
+    """Keyword RAG over an inverted index with BM25 scoring.
 
-    def __init__(self):
-        self.documents = self._get_sample_skills()
+    Postings, document lengths and IDF are computed once when documents are
+    added, so a query only touches the postings of its own terms.
+    """
 
-    def _get_sample_skills(self) -> List[Dict[str, str]]:
-        """Sample CV skills data"""
-        return [
-            {
-                "id": "programming",
-                "content": "Python programming with 3 years experience in web development, FastAPI, Django",
-                "keywords": ["python", "web", "development", "fastapi", "django", "programming"]
-            },
-            {
-                "id": "ml",
-                "content": "Machine learning expertise using scikit-learn and TensorFlow for data science",
-                "keywords": ["machine", "learning", "ml", "ai", "tensorflow", "scikit", "data", "science"]
-            },
-            {
-                "id": "data_analysis",
-                "content": "Data analysis with pandas and numpy for business intelligence and reporting",
-                "keywords": ["data", "analysis", "pandas", "numpy", "business", "intelligence", "reporting"]
-            },
-            {
-                "id": "databases",
-                "content": "SQL database design and optimization for large datasets and performance tuning",
-                "keywords": ["sql", "database", "optimization", "performance", "datasets"]
-            },
-            {
-                "id": "frontend",
-                "content": "React.js frontend development with modern JavaScript and responsive design",
-                "keywords": ["react", "frontend", "javascript", "ui", "responsive", "design"]
-            },
-            {
-                "id": "apis",
-                "content": "RESTful API development using FastAPI and Django for microservices",
-                "keywords": ["api", "rest", "fastapi", "django", "microservices", "backend"]
-            },
-            {
-                "id": "cloud",
-                "content": "Cloud deployment experience with AWS, Docker containers and DevOps",
-                "keywords": ["cloud", "aws", "docker", "devops", "deployment", "containers"]
-            },
-            {
-                "id": "management",
-                "content": "Project management skills with Agile methodologies and team leadership",
-                "keywords": ["project", "management", "agile", "leadership", "team", "scrum"]
-            }
+    def __init__(self, documents: Optional[List[Dict[str, str]]] = None):
+        self.documents: List[Dict[str, str]] = []
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.doc_lengths: List[float] = []
+        self._length_norms: List[float] = []
+        self._idf: Dict[str, float] = {}
+        self._dirty = False
+        self.add_documents(get_sample_skills() if documents is None else documents)
+
+    def add_documents(self, documents: List[Dict[str, str]]):
+        """Index documents with `content` and optional `keywords`"""
+        for doc in documents:
+            doc_idx = len(self.documents)
+            tf = Counter(tokenize(doc["content"]))
+            for keyword in doc.get("keywords", ()):
+                for token in tokenize(keyword):
+                    tf[token] += KEYWORD_WEIGHT
+            for term, freq in tf.items():
+                self.postings.setdefault(term, []).append((doc_idx, freq))
+            self.documents.append(doc)
+            self.doc_lengths.append(sum(tf.values()))
+        self._dirty = True
+
+    def _refresh(self):
+        """Recompute IDF and per-document length norms after documents change"""
+        n_docs = len(self.documents)
+        avg_length = (sum(self.doc_lengths) / n_docs) if n_docs else 1.0
+        self._length_norms = [
+            BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) for length in self.doc_lengths
         ]
+        self._idf = {
+            term: math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+        self._dirty = False
+
+    def search(self, question: str, n_results: int = 3) -> List[Tuple[float, Dict[str, str]]]:
+        """Top `n_results` (score, document) pairs by BM25"""
+        if self._dirty:
+            self._refresh()
+        scores: Dict[int, float] = {}
+        norms = self._length_norms
+        for term, query_tf in Counter(tokenize(question)).items():
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            weight = self._idf[term] * query_tf * (BM25_K1 + 1)
+            for doc_idx, tf in plist:
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + weight * tf / (tf + norms[doc_idx])
+
+        top = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+        return [(score, self.documents[doc_idx]) for doc_idx, score in top]
 
-    def _score_document(self, doc: Dict[str, str], query_words: List[str]) -> float:
-        """Simple keyword matching score"""
-        score = 0
-        doc_keywords = doc["keywords"]
-        doc_content = doc["content"].lower()
+    def has_term(self, term: str) -> bool:
+        """Whether `term` (a tokenize() token) occurs in the index"""
+        return term in self.postings
 
-        for word in query_words:
-            # Exact keyword match
-            if word in doc_keywords:
-                score += 2
-            # Partial content match
-            elif word in doc_content:
-                score += 1
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the documents and the index"""
+        if self._dirty:
+            self._refresh()
+        postings = strings_bytes(self.postings) + sum(
+            sys.getsizeof(plist) + len(plist) * POSTING_BYTES for plist in self.postings.values()
+        )
+        per_doc = 2 * (8 + sys.getsizeof(0.0))  # doc_lengths and _length_norms
+        per_term = sys.getsizeof(0.0)  # _idf values; its keys are the postings' strings
+        return (documents_bytes(self.documents) + postings + sys.getsizeof(self._idf)
+                + len(self._idf) * per_term + len(self.documents) * per_doc)
 
-        return score
+    def search_batch(self, questions: List[str], n_results: int = 3) -> List[List[Tuple[float, Dict[str, str]]]]:
+        """search() for several questions"""
+        return [self.search(question, n_results) for question in questions]
 
     def query(self, question: str, n_results: int = 3) -> str:
         """Query the simple RAG system"""
         try:
-            # Extract keywords from question
-            query_words = re.findall(r'\b\w+\b', question.lower())
+            top_docs = self.search(question, n_results)
+            return format_skills([doc for score, doc in top_docs])
+
+        except Exception as e:
+            return f"RAG query error: {str(e)}"
+
+def _hashed_features(text: str, keywords=()) -> Counter:
+    """Weighted word and character n-gram features of a text, keyed by hash bucket"""
+    features = Counter()
+    tokens = [(token, 1.0) for token in tokenize(text)]
+    tokens += [(token, KEYWORD_WEIGHT) for keyword in keywords for token in tokenize(keyword)]
+    for token, weight in tokens:
+        features["w:" + token] += weight
+        padded = f"<{token}>"
+        for i in range(len(padded) - CHAR_NGRAM + 1):
+            features["c:" + padded[i:i + CHAR_NGRAM]] += weight * CHAR_NGRAM_WEIGHT
+    return features
+
+def hash_bucket(feature: str, dim: int) -> Tuple[int, float]:
+    """Stable (bucket, sign) of a feature; Python's hash() is salted per process"""
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dim, (1.0 if (h >> 31) & 1 else -1.0)
+
+def hashed_vector(text: str, keywords=(), dim: int = VECTOR_DIM):
+    """Signed log-tf vector of a text's hashed features (not normalised)"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in _hashed_features(text, keywords).items():
+        bucket, sign = hash_bucket(feature, dim)
+        vector[bucket] += sign * (1.0 + math.log(count))
+    return vector
 
-            # Score documents
-            scored_docs = []
-            for doc in self.documents:
-                score = self._score_document(doc, query_words)
-                if score > 0:
-                    scored_docs.append((score, doc))
+def normalise_rows(rows):
+    """L2-normalise each row of a float32 matrix"""
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (rows / norms).astype(np.float32)
 
-            # Sort by score and get top results
-            scored_docs.sort(key=lambda x: x[0], reverse=True)
-            top_docs = scored_docs[:n_results]
+def vector_idf(doc_freq, n_docs: int):
+    """Smoothed IDF per hash bucket"""
+    return (np.log((1 + n_docs) / (1 + doc_freq)) + 1.0).astype(np.float32)
 
-            if not top_docs:
-                return "No relevant skills found in the CV for your query."
+def active_scores(matrix, query, active):
+    """matrix[:, active] @ query[active]: only the query's non-zero columns are read"""
+    weights = query[active]
+    scores = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+        block = matrix[start:start + SCORE_BLOCK_ROWS]
+        scores[start:start + SCORE_BLOCK_ROWS] = block[:, active] @ weights
+    return scores
 
-            # Format results
-            skills = [doc["content"] for score, doc in top_docs]
-            formatted_skills = "\n".join([f"• {skill}" for skill in skills])
+def top_k_indices(scores, n_results: int):
+    """Indices of the highest scores, best first, above MIN_SIMILARITY"""
+    if n_results <= 0:
+        return []
+    # Partition only the documents that can be returned at all
+    top = np.flatnonzero(scores >= MIN_SIMILARITY)
+    if top.size > n_results:
+        top = top[np.argpartition(scores[top], top.size - n_results)[-n_results:]]
+    return [int(i) for i in top[np.argsort(-scores[top])]]
 
-            return f"Current skills found in CV:\n{formatted_skills}"
+class VectorRAG:
+    """Hashed TF-IDF vectors in one contiguous float32 matrix.
+
+    Features are word and character n-gram counts hashed into `dim` buckets
+    (signed, so collisions tend to cancel), so nothing has to be downloaded
+    or trained. Weighting is lnc.ltc: document rows are L2-normalised log
+    term frequencies and only queries carry IDF, so appending documents
+    never rewrites existing rows. The matrix is stored column-major: a
+    query touches only the columns of its own features, and a batch of
+    queries is one matrix-matrix product, each followed by argpartition.
+    """
+
+    def __init__(self, documents: Optional[List[Dict[str, str]]] = None, dim: int = VECTOR_DIM):
+        if np is None:
+            raise RuntimeError("The vector RAG backend requires numpy")
+        self.dim = dim
+        self.documents: List[Dict[str, str]] = []
+        self.matrix = np.zeros((0, dim), dtype=np.float32, order="F")
+        self.doc_freq = np.zeros(dim, dtype=np.int64)
+        self.idf = np.ones(dim, dtype=np.float32)
+        self.terms = set()  # hashed features can't be reversed, so words are kept for has_term()
+        self.add_documents(get_sample_skills() if documents is None else documents)
+
+    def add_documents(self, documents: List[Dict[str, str]]):
+        """Encode documents with `content` and optional `keywords`"""
+        if not documents:
+            return
+        rows = np.empty((len(documents), self.dim), dtype=np.float32)
+        for row, doc in enumerate(documents):
+            rows[row] = hashed_vector(doc["content"], doc.get("keywords", ()), self.dim)
+            self.terms.update(tokenize(" ".join([doc["content"], *doc.get("keywords", ())])))
+        self.doc_freq += np.count_nonzero(rows, axis=0)
+        self.documents.extend(documents)
+        self.idf = vector_idf(self.doc_freq, len(self.documents))
+        self.matrix = np.asfortranarray(np.vstack([self.matrix, normalise_rows(rows)]))
+
+    def encode(self, questions: List[str]):
+        """Query vectors in the document space, one row per question"""
+        rows = np.stack([hashed_vector(question, dim=self.dim) for question in questions]) * self.idf
+        return normalise_rows(rows)
+
+    def _top_k(self, scores, n_results: int) -> List[Tuple[float, Dict[str, str]]]:
+        return [(float(scores[i]), self.documents[i]) for i in top_k_indices(scores, n_results)]
+
+    def has_term(self, term: str) -> bool:
+        """Whether `term` (a tokenize() token) occurs in the indexed documents"""
+        return term in self.terms
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the documents, vectors and vocabulary"""
+        arrays = self.matrix.nbytes + self.doc_freq.nbytes + self.idf.nbytes
+        return documents_bytes(self.documents) + arrays + strings_bytes(self.terms)
+
+    def search(self, question: str, n_results: int = 3) -> List[Tuple[float, Dict[str, str]]]:
+        """Top `n_results` (cosine similarity, document) pairs"""
+        query = self.encode([question])[0]
+        active = np.flatnonzero(query)
+        if active.size == 0:
+            return []
+        scores = active_scores(self.matrix, query, active)
+        return self._top_k(scores, n_results)
+
+    def search_batch(self, questions: List[str], n_results: int = 3) -> List[List[Tuple[float, Dict[str, str]]]]:
+        """search() for several questions with one matrix-matrix product"""
+        if not questions:
+            return []
+        scores = self.encode(questions) @ self.matrix.T
+        return [self._top_k(row, n_results) for row in scores]
+
+    def query(self, question: str, n_results: int = 3) -> str:
+        """Query the vector RAG system"""
+        try:
+            top_docs = self.search(question, n_results)
+            return format_skills([doc for score, doc in top_docs])
 
         except Exception as e:
             return f"RAG query error: {str(e)}"
 
-# Global RAG instance
-rag_system = SimpleRAG()
+RAG_BACKENDS = {"keyword": SimpleRAG, "vector": VectorRAG}
+
+def create_rag(backend: str = RAG_BACKEND, documents: Optional[List[Dict[str, str]]] = None):
+    """Build a retrieval backend by name ("keyword" or "vector")"""
+    if backend not in RAG_BACKENDS:
+        raise ValueError(f"Unknown RAG backend '{backend}', expected one of {sorted(RAG_BACKENDS)}")
+    return RAG_BACKENDS[backend](documents)
+
+# Global RAG instance, built on first use. With RAG_INDEX_PATH set it is an
+# mmap-backed index written by rag_index.py instead of the sample skills,
+# searched by RAG_SHARD_WORKERS processes when that is above 0 (rag_shards.py).
+RAG_INDEX_PATH = os.getenv("RAG_INDEX_PATH")
+RAG_SHARD_WORKERS = int(os.getenv("RAG_SHARD_WORKERS", "0"))
+rag_system = None
+
+def get_rag_system():
+    """The process-wide RAG backend"""
+    global rag_system
+    if rag_system is None:
+        if RAG_INDEX_PATH and RAG_SHARD_WORKERS > 0:
+            from rag_shards import ShardedRAG
+            rag_system = ShardedRAG(RAG_INDEX_PATH, backend=RAG_BACKEND, workers=RAG_SHARD_WORKERS)
+            rag_system.warm_up()
+        elif RAG_INDEX_PATH:
+            from rag_index import MmapRAG
+            rag_system = MmapRAG(RAG_INDEX_PATH, backend=RAG_BACKEND)
+        else:
+            rag_system = create_rag(RAG_BACKEND)
+    return rag_system
+
+class Vocabulary:
+    """The terms of a set of documents, for has_term() without a search backend"""
+
+    def __init__(self, documents: List[Dict[str, str]]):
+        self.terms = set()
+        for doc in documents:
+            self.terms.update(tokenize(" ".join([doc["content"], *doc.get("keywords", ())])))
+
+    def has_term(self, term: str) -> bool:
+        return term in self.terms
+
+vocabulary = None
+
+def get_vocabulary():
+    """has_term() over the skills index without building rag_system (no worker pool):
+    the term tables of RAG_INDEX_PATH, memory-mapped, or the sample skills' terms"""
+    global vocabulary
+    if vocabulary is None:
+        if RAG_INDEX_PATH:
+            from rag_index import MmapRAG
+            vocabulary = MmapRAG(RAG_INDEX_PATH)
+        else:
+            vocabulary = Vocabulary(get_sample_skills())
+    return vocabulary
+
+def query_skills(question: str, conversation_id: str = None) -> Tuple[str, bool]:
+    """Skills for `question` from the conversation's own CV index if it has one (rag_tenants.py),
+    and whether that index answered"""
+    from rag_tenants import rag_for
+    with rag_for(conversation_id) as (rag, own_index):
+        return rag.query(question), own_index
+
+def query_skills_batch(questions: List[str], n_results: int = 3,
+                       conversation_id: str = None) -> Tuple[List[str], bool]:
+    """query_skills() for several questions in one search_batch() call"""
+    from rag_tenants import rag_for
+    with rag_for(conversation_id) as (rag, own_index):
+        return [
+            format_skills([doc for score, doc in top_docs])
+            for top_docs in rag.search_batch(questions, n_results)
+        ], own_index
 
 def query_local_rag(question: str, conversation_id: str = None) -> str:
-    """Function compatible with the existing MCP interface"""
-    return rag_system.query(question)
\ No newline at end of file
+    """Skills for `question` from the conversation's own CV index if it has one"""
+    return query_skills(question, conversation_id)[0]
+
+def query_local_rag_batch(questions: List[str], n_results: int = 3, conversation_id: str = None) -> List[str]:
+    """query_local_rag() for several questions in one search_batch() call"""
+    return query_skills_batch(questions, n_results, conversation_id)[0]
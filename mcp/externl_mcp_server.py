@@ -1,16 +1,31 @@
 from mcp.server.fastmcp import FastMCP
 from fastapi import Request
-import os, sys
+import os, sys, asyncio, argparse
 import uvicorn
 from dotenv import load_dotenv
 from duckduckgo_search import DDGS
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from telemetry import get_logger, span
+from search_cache import SearchCache
 load_dotenv()
 
+logger = get_logger("search_mcp")
+
+# Transport and address; override with --transport/--host/--port
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "0.0.0.0")
+MCP_PORT = int(os.getenv("MCP_PORT", "8080"))
+
 # Initialize MCP app
-mcp = FastMCP(name="websearch_resources", host="0.0.0.0", port=8080)
+mcp = FastMCP(name="websearch_resources", host=MCP_HOST, port=MCP_PORT)
+
+# Bound on one DuckDuckGo search, so a hung request can't hold a tool call forever
+DDG_TIMEOUT = float(os.getenv("DDG_TIMEOUT", "5"))
 
 # Free DuckDuckGo search - no API key needed
-ddgs = DDGS()
+ddgs = DDGS(timeout=int(DDG_TIMEOUT) or 1)
+# Results shared with the other search servers on this host (search_cache.py)
+search_cache = SearchCache()
 
 # Register tool
 @mcp.tool(name="websearch_resources")
@@ -18,10 +33,17 @@ async def websearch_resources(refined_query: str, skill_summary: str = "") -> st
     try:
         # Enhance query with skill context
         search_query = f"{refined_query} skills training courses resources"
-        print(f"FastMCP DuckDuckGo search: {search_query}")
+        logger.debug("FastMCP DuckDuckGo search: %s", search_query)
 
         # DuckDuckGo search (free)
-        results = ddgs.text(search_query, max_results=5)
+        async def ddg_search():
+            with span("search.ddg"):
+                # Off the event loop, so concurrent calls on a shared connection overlap
+                return await asyncio.wait_for(
+                    asyncio.to_thread(ddgs.text, search_query, max_results=5), DDG_TIMEOUT
+                )
+
+        results = await search_cache.search(refined_query, 5, ddg_search)
 
         if not results:
             return "No search results found."
@@ -36,17 +58,25 @@ async def websearch_resources(refined_query: str, skill_summary: str = "") -> st
 
         answer = f"Based on your query '{refined_query}', here are relevant skill resources:\n\n" + "\n".join(formatted_results)
 
-        print(f"FastMCP Output: Found {len(results)} results")
+        logger.debug("FastMCP Output: Found %d results", len(results))
         return answer
 
+    except asyncio.TimeoutError:
+        return f"[DuckDuckGo Search Error] no answer within {DDG_TIMEOUT:.0f}s"
     except Exception as e:
         return f"[DuckDuckGo Search Error] {str(e)}"
 
 
 # Run server
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Web search MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default=MCP_TRANSPORT)
+    parser.add_argument("--host", default=MCP_HOST)
+    parser.add_argument("--port", type=int, default=MCP_PORT)
+    args = parser.parse_args()
+    mcp.settings.host, mcp.settings.port = args.host, args.port
     try:
-        print("🎯 MCP Search Stdio started", file=sys.stderr, flush=True)
-        mcp.run(transport='stdio')
+        logger.info("MCP Search %s server started", args.transport)
+        mcp.run(transport=args.transport)
     except Exception as e:
-        print(f"❌ MCP Search crashed on startup: {e}", flush=True)
+        logger.error("MCP Search crashed on startup: %s", e)
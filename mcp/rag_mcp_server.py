@@ -1,35 +1,66 @@
 from mcp.server.fastmcp import FastMCP
+import mcp.types as types
 from fastapi import Request
-import os, sys
+import os, sys, json, asyncio, argparse
 import uvicorn
 from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from local_rag import query_local_rag
+from local_rag import query_skills, query_skills_batch, get_rag_system
+from telemetry import get_logger, span
 load_dotenv()
 
-mcp = FastMCP(name="get_skills")
+logger = get_logger("rag_mcp")
+
+# Transport and address; override with --transport/--host/--port
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8001"))
+
+mcp = FastMCP(name="get_skills", host=MCP_HOST, port=MCP_PORT)
 
 # Register tool
+def tool_result(text: str, own_index: bool) -> types.CallToolResult:
+    # tenant_index tells the client the skills came from the conversation's own CV index and mustn't be shared
+    return types.CallToolResult(content=[types.TextContent(type="text", text=text)], _meta={"tenant_index": own_index})
+
 @mcp.tool(name="get_skills")
-async def get_skills(user_input: str, conversation_id: str) -> str:
+async def get_skills(user_input: str, conversation_id: str | None = None) -> types.CallToolResult:
     try:
-        print(f"Local RAG get_skills: {user_input}")
+        logger.debug("Local RAG get_skills: %s", user_input)
 
         # Use local RAG instead of Azure Function
-        answer = query_local_rag(user_input, conversation_id)
+        with span("rag.score"):
+            answer, own_index = await asyncio.to_thread(query_skills, user_input, conversation_id)
 
-        print(f"Local RAG Output: {answer}")
+        logger.debug("Local RAG Output: %s", answer)
         if not answer or "no relevant skills" in answer.lower():
-           return "[NO_CV_SKILLS_FOUND]"
-        return answer
+           return tool_result("[NO_CV_SKILLS_FOUND]", own_index)
+        return tool_result(answer, own_index)
 
     except Exception as e:
-        return f"[Local RAG Error] {e}"
+        return tool_result(f"[Local RAG Error] {e}", False)
+
+@mcp.tool(name="get_skills_batch")
+async def get_skills_batch(queries: list[str], conversation_id: str | None = None) -> types.CallToolResult:
+    """Skills for several queries as a JSON list, in query order"""
+    try:
+        with span("rag.score_batch"):
+            results, own_index = await asyncio.to_thread(query_skills_batch, queries, conversation_id=conversation_id)
+        return tool_result(json.dumps(results), own_index)
+    except Exception as e:
+        return tool_result(json.dumps([f"[Local RAG Error] {e}"] * len(queries)), False)
 
 # Run server
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Skills RAG MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default=MCP_TRANSPORT)
+    parser.add_argument("--host", default=MCP_HOST)
+    parser.add_argument("--port", type=int, default=MCP_PORT)
+    args = parser.parse_args()
+    mcp.settings.host, mcp.settings.port = args.host, args.port
     try:
-        print("🎯 MCP Stdio started", file=sys.stderr, flush=True)
-        mcp.run(transport='stdio')
+        logger.info("MCP %s server started", args.transport)
+        get_rag_system()
+        mcp.run(transport=args.transport)
     except Exception as e:
-        print(f"❌ MCP crashed on startup: {e}", flush=True)
+        logger.error("MCP crashed on startup: %s", e)
@@ -3,31 +3,92 @@ import os
 import sys
 import asyncio
 import json
+from typing import Tuple
 from mcp.server.stdio import stdio_server
 from mcp.server import Server
+import mcp.types as types
 
 # Add parent directory to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from local_rag import query_local_rag
+from local_rag import query_skills, query_skills_batch, get_rag_system
+from telemetry import get_logger, span, collect_spans
+
+logger = get_logger("rag_mcp")
 
 # Create MCP server
 app = Server("rag-skills-server")
 
-@app.call_tool()
-async def get_skills(user_input: str, conversation_id: str) -> list[str]:
-    """Get skills from local RAG system"""
+async def get_skills(user_input: str, conversation_id: str = None) -> Tuple[str, bool]:
+    """Get skills from local RAG system, and whether the conversation's own index answered"""
+    try:
+        logger.debug("Processing: %s", user_input)
+        with span("rag.score"):
+            result, own_index = await asyncio.to_thread(query_skills, user_input, conversation_id)
+        logger.debug("Result: %d chars", len(result))
+        return result, own_index
+    except Exception as e:
+        error_msg = f"[RAG Error] {str(e)}"
+        logger.warning(error_msg)
+        return error_msg, False
+
+async def get_skills_batch(queries: list[str], conversation_id: str = None) -> Tuple[str, bool]:
+    """Get skills for several queries as a JSON list in query order, and whether the conversation's own index answered"""
     try:
-        print(f"🎯 [RAG MCP] Processing: {user_input}", file=sys.stderr)
-        result = query_local_rag(user_input, conversation_id)
-        print(f"✅ [RAG MCP] Result: {len(result)} chars", file=sys.stderr)
-        return [result]
+        logger.debug("Processing batch of %d queries", len(queries))
+        with span("rag.score_batch"):
+            results, own_index = await asyncio.to_thread(query_skills_batch, queries, conversation_id=conversation_id)
+        return json.dumps(results), own_index
     except Exception as e:
         error_msg = f"[RAG Error] {str(e)}"
-        print(f"❌ [RAG MCP] {error_msg}", file=sys.stderr)
-        return [error_msg]
+        logger.warning(error_msg)
+        return json.dumps([error_msg] * len(queries)), False
+
+TOOLS = {"get_skills": get_skills, "get_skills_batch": get_skills_batch}
+
+@app.list_tools()
+async def list_tools() -> list[types.Tool]:
+    return [
+        types.Tool(
+            name="get_skills",
+            description="Get skills from the local CV RAG system",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "user_input": {"type": "string"},
+                    "conversation_id": {"type": ["string", "null"]},
+                },
+                "required": ["user_input"],
+            },
+        ),
+        types.Tool(
+            name="get_skills_batch",
+            description="Get skills for several queries at once; returns a JSON list of results",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "queries": {"type": "array", "items": {"type": "string"}},
+                    "conversation_id": {"type": ["string", "null"]},
+                },
+                "required": ["queries"],
+            },
+        ),
+    ]
+
+@app.call_tool()
+async def call_tool(name: str, arguments: dict) -> types.CallToolResult:
+    if name not in TOOLS:
+        raise ValueError(f"Unknown tool: {name}")
+    # Server-side spans travel back in _meta so the client's /metrics sees them; tenant_index
+    # tells the client the skills came from the conversation's own CV index and mustn't be shared
+    with collect_spans() as spans:
+        result, own_index = await TOOLS[name](**arguments)
+    return types.CallToolResult(content=[types.TextContent(type="text", text=result)],
+                                _meta={"spans": spans, "tenant_index": own_index})
 
 async def main():
-    print("🎯 RAG MCP Stdio Server starting...", file=sys.stderr)
+    logger.info("RAG MCP Stdio Server starting...")
+    # Open the skills index before the handshake so the first call doesn't pay for it
+    get_rag_system()
     async with stdio_server() as (read_stream, write_stream):
         await app.run(read_stream, write_stream, app.create_initialization_options())
 
@@ -4,26 +4,44 @@ import sys
 import asyncio
 from mcp.server.stdio import stdio_server
 from mcp.server import Server
+import mcp.types as types
 from duckduckgo_search import DDGS
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from telemetry import get_logger, span, collect_spans
+from search_cache import SearchCache
+
+logger = get_logger("search_mcp")
+
+# Bound on one DuckDuckGo search, so a hung request can't hold a tool call forever
+DDG_TIMEOUT = float(os.getenv("DDG_TIMEOUT", "5"))
+
+# One DuckDuckGo session for every call, so connections are reused
+ddgs = DDGS(timeout=int(DDG_TIMEOUT) or 1)
+# Results shared with the other search servers on this host (search_cache.py)
+search_cache = SearchCache()
+
 # Create MCP server
 app = Server("search-resources-server")
 
-@app.call_tool()
-async def websearch_resources(refined_query: str, skill_summary: str = "") -> list[str]:
+async def websearch_resources(refined_query: str, skill_summary: str = "") -> str:
     """Search for web resources using DuckDuckGo"""
     try:
-        print(f"🎯 [Search MCP] Processing: {refined_query}", file=sys.stderr)
+        logger.debug("Processing: %s", refined_query)
 
-        # Initialize DuckDuckGo search
-        ddgs = DDGS()
         search_query = f"{refined_query} skills training courses resources"
 
-        # Perform search
-        results = ddgs.text(search_query, max_results=3)
+        async def ddg_search():
+            with span("search.ddg"):
+                # Off the event loop, so a slow search doesn't stall this server's other calls
+                return await asyncio.wait_for(
+                    asyncio.to_thread(ddgs.text, search_query, max_results=3), DDG_TIMEOUT
+                )
+
+        results = await search_cache.search(refined_query, 3, ddg_search)
 
         if not results:
-            return ["No search results found."]
+            return "No search results found."
 
         # Format results
         formatted_results = []
@@ -35,16 +53,46 @@ async def websearch_resources(refined_query: str, skill_summary: str = "") -> li
 
         answer = f"Based on your query '{refined_query}', here are relevant skill resources:\n\n" + "\n".join(formatted_results)
 
-        print(f"✅ [Search MCP] Found {len(results)} results", file=sys.stderr)
-        return [answer]
+        logger.debug("Found %d results", len(results))
+        return answer
 
+    except asyncio.TimeoutError:
+        error_msg = f"[Search Error] DuckDuckGo did not answer within {DDG_TIMEOUT:.0f}s"
+        logger.warning(error_msg)
+        return error_msg
     except Exception as e:
         error_msg = f"[Search Error] {str(e)}"
-        print(f"❌ [Search MCP] {error_msg}", file=sys.stderr)
-        return [error_msg]
+        logger.warning(error_msg)
+        return error_msg
+
+@app.list_tools()
+async def list_tools() -> list[types.Tool]:
+    return [
+        types.Tool(
+            name="websearch_resources",
+            description="Search the web for skill resources using DuckDuckGo",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "refined_query": {"type": "string"},
+                    "skill_summary": {"type": "string"},
+                },
+                "required": ["refined_query"],
+            },
+        )
+    ]
+
+@app.call_tool()
+async def call_tool(name: str, arguments: dict) -> types.CallToolResult:
+    if name != "websearch_resources":
+        raise ValueError(f"Unknown tool: {name}")
+    # Server-side spans travel back in _meta so the client's /metrics sees them
+    with collect_spans() as spans:
+        result = await websearch_resources(**arguments)
+    return types.CallToolResult(content=[types.TextContent(type="text", text=result)], _meta={"spans": spans})
 
 async def main():
-    print("🎯 Search MCP Stdio Server starting...", file=sys.stderr)
+    logger.info("Search MCP Stdio Server starting...")
     async with stdio_server() as (read_stream, write_stream):
         await app.run(read_stream, write_stream, app.create_initialization_options())
 
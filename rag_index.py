@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""On-disk, memory-mapped skills index for local_rag.
+
+    python rag_index.py build cvs/ skills.idx             # directory of .jsonl/.json/.txt/.md
+    python rag_index.py build new_cv.jsonl skills.idx --append
+    python rag_index.py info skills.idx
+    RAG_INDEX_PATH=skills.idx python mcp/rag_mcp_stdio.py
+
+An index is a directory with a manifest.json and one or more segment
+files. Each build or append streams the source documents into new
+segments of at most --segment-docs documents, so appending one CV never
+rewrites the existing ones. Segment files are named by build
+(seg-<generation>-<n>.bin) and a rebuild deletes the old ones only after
+the new manifest is in place, so readers never see a mix of the two. A segment holds a string table of documents
+and terms, BM25 postings, document lengths and, optionally, the hashed
+TF-IDF matrix of the vector backend. Readers mmap the segments
+read-only: opening an index only parses headers, and server processes
+that open the same index share its page cache.
+"""
+import os
+import sys
+import json
+import mmap
+import math
+import heapq
+import bisect
+import struct
+import argparse
+from array import array
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from local_rag import (
+    BM25_B, BM25_K1, KEYWORD_WEIGHT, VECTOR_DIM, active_scores, format_skills, hashed_vector,
+    normalise_rows, np, tokenize, top_k_indices, vector_idf,
+)
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+SEGMENT_MAGIC = b"RAGSEG01"
+SEGMENT_DOCS = 100_000
+SECTIONS = (
+    "doc_offsets", "doc_blob", "doc_lengths",
+    "term_offsets", "term_blob",
+    "posting_offsets", "posting_docs", "posting_tfs",
+    "doc_freq", "matrix",
+)
+HEADER = struct.Struct("<8sIIIId" + "QQ" * len(SECTIONS))
+ALIGNMENT = 64
+
+
+# ------------------ Source Documents ------------------
+def _documents_from_file(path: str) -> Iterator[Dict]:
+    name = os.path.basename(path)
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    doc = json.loads(line)
+                    doc.setdefault("id", f"{name}:{line_no}")
+                    yield doc
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for i, doc in enumerate(data if isinstance(data, list) else [data]):
+            doc.setdefault("id", f"{name}:{i}")
+            yield doc
+    elif path.endswith((".txt", ".md")):
+        # One document per paragraph of a plain-text CV
+        with open(path, encoding="utf-8") as f:
+            paragraph, n = [], 0
+            for line in f:
+                if line.strip():
+                    paragraph.append(line.strip())
+                elif paragraph:
+                    yield {"id": f"{name}#{n}", "content": " ".join(paragraph)}
+                    paragraph, n = [], n + 1
+            if paragraph:
+                yield {"id": f"{name}#{n}", "content": " ".join(paragraph)}
+
+
+def iter_documents(source: str) -> Iterator[Dict]:
+    """Stream documents from a .jsonl/.json/.txt/.md file or a directory of them"""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                yield from _documents_from_file(os.path.join(root, name))
+    else:
+        yield from _documents_from_file(source)
+
+
+# ------------------ Segment Writer ------------------
+class SegmentWriter:
+    """Accumulates documents for one segment and writes it in one pass"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.docs: List[bytes] = []
+        self.doc_lengths = array("f")
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.vectors: List = []
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, doc: Dict):
+        doc_idx = len(self.docs)
+        keywords = doc.get("keywords", ())
+        tf = Counter(tokenize(doc["content"]))
+        for keyword in keywords:
+            for token in tokenize(keyword):
+                tf[token] += KEYWORD_WEIGHT
+        for term, freq in tf.items():
+            self.postings.setdefault(term, []).append((doc_idx, freq))
+        self.doc_lengths.append(sum(tf.values()))
+        self.docs.append(json.dumps(
+            {"id": doc.get("id"), "content": doc["content"], "keywords": list(keywords)},
+            ensure_ascii=False,
+        ).encode("utf-8"))
+        if self.dim:
+            self.vectors.append(hashed_vector(doc["content"], keywords, self.dim))
+
+    def write(self, path: str):
+        doc_offsets = array("Q", [0])
+        for blob in self.docs:
+            doc_offsets.append(doc_offsets[-1] + len(blob))
+
+        terms = sorted(self.postings, key=lambda t: t.encode("utf-8"))
+        term_offsets, term_blob = array("Q", [0]), bytearray()
+        posting_offsets, posting_docs, posting_tfs = array("Q", [0]), array("I"), array("f")
+        for term in terms:
+            term_blob += term.encode("utf-8")
+            term_offsets.append(len(term_blob))
+            for doc_idx, freq in self.postings[term]:
+                posting_docs.append(doc_idx)
+                posting_tfs.append(freq)
+            posting_offsets.append(len(posting_docs))
+
+        doc_freq, matrix = b"", b""
+        if self.dim:
+            rows = normalise_rows(np.stack(self.vectors))
+            doc_freq = np.count_nonzero(rows, axis=0).astype(np.int64).tobytes()
+            matrix = rows.tobytes(order="F")  # column-major, as VectorRAG keeps it
+
+        sections = {
+            "doc_offsets": doc_offsets.tobytes(),
+            "doc_blob": b"".join(self.docs),
+            "doc_lengths": self.doc_lengths.tobytes(),
+            "term_offsets": term_offsets.tobytes(),
+            "term_blob": bytes(term_blob),
+            "posting_offsets": posting_offsets.tobytes(),
+            "posting_docs": posting_docs.tobytes(),
+            "posting_tfs": posting_tfs.tobytes(),
+            "doc_freq": doc_freq,
+            "matrix": matrix,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            layout = []
+            for name in SECTIONS:
+                f.write(b"\0" * (-f.tell() % ALIGNMENT))
+                layout += [f.tell(), len(sections[name])]
+                f.write(sections[name])
+            f.seek(0)
+            f.write(HEADER.pack(
+                SEGMENT_MAGIC, FORMAT_VERSION, len(self.docs), len(terms), self.dim,
+                float(sum(self.doc_lengths)), *layout,
+            ))
+        os.replace(tmp_path, path)
+
+
+# ------------------ Build ------------------
+def _read_manifest(index_dir: str) -> Optional[Dict]:
+    path = os.path.join(index_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(index_dir: str, manifest: Dict):
+    path = os.path.join(index_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def build_index(source: str, index_dir: str, append: bool = False,
+                dim: Optional[int] = None, segment_docs: int = SEGMENT_DOCS) -> Dict:
+    """Write `source` documents into an index directory; returns the manifest"""
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = _read_manifest(index_dir)
+    # Every build writes segments under names of its own, so a reader opening the
+    # current manifest's segments never sees one overwritten mid-rebuild
+    generation = (manifest or {}).get("generation", 0) + 1
+    if manifest and append:
+        if dim is not None and dim != manifest["dim"]:
+            raise ValueError(f"Index was built with dim={manifest['dim']}, cannot append with dim={dim}")
+        dim = manifest["dim"]
+    else:
+        old_segments = manifest["segments"] if manifest else []
+        dim = (VECTOR_DIM if np is not None else 0) if dim is None else dim
+        manifest = {"version": FORMAT_VERSION, "dim": dim, "segments": [], "documents": 0}
+    manifest["generation"] = generation
+    if dim and np is None:
+        raise RuntimeError("Building vectors requires numpy; use --dim 0 for a keyword-only index")
+
+    new_segments, writer = [], SegmentWriter(dim)
+
+    def flush():
+        name = f"seg-{generation:04d}-{len(new_segments):06d}.bin"
+        writer.write(os.path.join(index_dir, name))
+        new_segments.append(name)
+        manifest["documents"] += len(writer)
+
+    for doc in iter_documents(source):
+        writer.add(doc)
+        if len(writer) >= segment_docs:
+            flush()
+            writer = SegmentWriter(dim)
+    if len(writer):
+        flush()
+
+    manifest["segments"] += new_segments
+    _write_manifest(index_dir, manifest)
+    # Only now that the manifest no longer lists them
+    if not append:
+        for name in set(old_segments) - set(manifest["segments"]):
+            os.remove(os.path.join(index_dir, name))
+    return manifest
+
+
+# ------------------ Memory-Mapped Reader ------------------
+class IndexSegment:
+    """Read-only view of one segment file; nothing is copied until used"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mm, 0)
+        magic, version, self.n_docs, self.n_terms, self.dim, self.total_length = header[:6]
+        if magic != SEGMENT_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} index segment")
+        layout = header[6:]
+        self._layout = {name: (layout[2 * i], layout[2 * i + 1]) for i, name in enumerate(SECTIONS)}
+        self._view = memoryview(self._mm)
+        self.doc_offsets = self._section("doc_offsets", "Q")
+        self.doc_blob = self._section("doc_blob")
+        self.doc_lengths = self._section("doc_lengths", "f")
+        self.term_offsets = self._section("term_offsets", "Q")
+        self.term_blob = self._section("term_blob")
+        self.posting_offsets = self._section("posting_offsets", "Q")
+        self.posting_docs = self._section("posting_docs", "I")
+        self.posting_tfs = self._section("posting_tfs", "f")
+        self._matrix = None
+
+    def _section(self, name: str, fmt: Optional[str] = None) -> memoryview:
+        offset, length = self._layout[name]
+        view = self._view[offset:offset + length]
+        return view.cast(fmt) if fmt else view
+
+    def term(self, i: int) -> bytes:
+        return bytes(self.term_blob[self.term_offsets[i]:self.term_offsets[i + 1]])
+
+    def find_term(self, term: bytes) -> int:
+        """Binary search the sorted term table; -1 if absent"""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_terms and self.term(lo) == term else -1
+
+    def postings(self, i: int) -> Tuple[memoryview, memoryview]:
+        start, end = self.posting_offsets[i], self.posting_offsets[i + 1]
+        return self.posting_docs[start:end], self.posting_tfs[start:end]
+
+    def document(self, i: int) -> Dict:
+        return json.loads(bytes(self.doc_blob[self.doc_offsets[i]:self.doc_offsets[i + 1]]))
+
+    @property
+    def doc_freq(self):
+        offset, length = self._layout["doc_freq"]
+        return np.frombuffer(self._mm, dtype=np.int64, count=length // 8, offset=offset)
+
+    @property
+    def matrix(self):
+        """The segment's vectors as an (n_docs, dim) column-major array over the mmap"""
+        if self._matrix is None:
+            offset, length = self._layout["matrix"]
+            flat = np.frombuffer(self._mm, dtype=np.float32, count=length // 4, offset=offset)
+            self._matrix = flat.reshape((self.n_docs, self.dim), order="F")
+        return self._matrix
+
+
+class MmapRAG:
+    """SimpleRAG/VectorRAG over an index written by build_index().
+
+    `backend` picks BM25 ("keyword") or hashed TF-IDF ("vector") scoring;
+    both return the same formatted output as the in-memory backends.
+    """
+
+    def __init__(self, index_dir: str, backend: str = "keyword"):
+        manifest = _read_manifest(index_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"No {MANIFEST} in {index_dir}; build it with rag_index.py build")
+        if backend not in ("keyword", "vector"):
+            raise ValueError(f"Unknown RAG backend '{backend}'")
+        if backend == "vector" and not manifest["dim"]:
+            raise ValueError(f"{index_dir} was built without vectors (dim=0)")
+        self.backend = backend
+        self.dim = manifest["dim"]
+        self.segments = [IndexSegment(os.path.join(index_dir, name)) for name in manifest["segments"]]
+        self._bases = []
+        total = 0
+        for segment in self.segments:
+            self._bases.append(total)
+            total += segment.n_docs
+        self.n_docs = total
+        self.avg_length = (sum(s.total_length for s in self.segments) / total) if total else 1.0
+        self._idf = None
+
+    def document(self, doc_id: int) -> Dict:
+        seg_no = bisect.bisect_right(self._bases, doc_id) - 1
+        return self.segments[seg_no].document(doc_id - self._bases[seg_no])
+
+    def has_term(self, term: str) -> bool:
+        """Whether `term` (a tokenize() token) is in any segment's term table"""
+        key = term.encode("utf-8")
+        return any(segment.find_term(key) >= 0 for segment in self.segments)
+
+    def memory_bytes(self) -> int:
+        """Bytes mapped from the segment files; at most this much is resident"""
+        return sum(len(segment._mm) for segment in self.segments)
+
+    def keyword_weights(self, question: str) -> List[Tuple[bytes, float]]:
+        """(term, BM25 query weight) pairs, with IDF from the document frequency across all segments"""
+        weights = []
+        for term, query_tf in Counter(tokenize(question)).items():
+            key = term.encode("utf-8")
+            df = 0
+            for segment in self.segments:
+                idx = segment.find_term(key)
+                if idx >= 0:
+                    df += segment.posting_offsets[idx + 1] - segment.posting_offsets[idx]
+            if df:
+                idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+                weights.append((key, idf * query_tf * (BM25_K1 + 1)))
+        return weights
+
+    def score_keyword(self, weights: List[Tuple[bytes, float]], n_results: int,
+                      seg_nos: Optional[List[int]] = None) -> List[Tuple[float, int]]:
+        """Top (score, doc_id) pairs among the segments `seg_nos` (default all)"""
+        scores: Dict[int, float] = {}
+        for seg_no in range(len(self.segments)) if seg_nos is None else seg_nos:
+            segment, base = self.segments[seg_no], self._bases[seg_no]
+            lengths = segment.doc_lengths
+            for key, weight in weights:
+                idx = segment.find_term(key)
+                if idx < 0:
+                    continue
+                docs, tfs = segment.postings(idx)
+                for doc_idx, tf in zip(docs, tfs):
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_idx] / self.avg_length)
+                    doc_id = base + doc_idx
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf / (tf + norm)
+        # Ties go to the lower doc id, so any split into segments ranks the same way
+        top = heapq.nlargest(n_results, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(score, doc_id) for doc_id, score in top]
+
+    def _search_keyword(self, question: str, n_results: int) -> List[Tuple[float, int]]:
+        return self.score_keyword(self.keyword_weights(question), n_results)
+
+    @property
+    def idf(self):
+        if self._idf is None:
+            doc_freq = sum(segment.doc_freq for segment in self.segments)
+            self._idf = vector_idf(doc_freq, self.n_docs)
+        return self._idf
+
+    def encode(self, questions: List[str]):
+        rows = np.stack([hashed_vector(question, dim=self.dim) for question in questions]) * self.idf
+        return normalise_rows(rows)
+
+    def _vector_scores(self, queries):
+        """(n_queries, n_docs) cosine scores against every segment"""
+        if not self.segments:
+            return np.zeros((queries.shape[0], 0), dtype=np.float32)
+        return np.hstack([queries @ segment.matrix.T for segment in self.segments])
+
+    def score_vector(self, queries, n_results: int, seg_nos: List[int]) -> List[List[Tuple[float, int]]]:
+        """Per encoded query, the top (score, doc_id) pairs among the segments `seg_nos`"""
+        # Only the dimensions some query uses, like _search_vector()
+        active = np.flatnonzero(queries.any(axis=0))
+        if not seg_nos or active.size == 0:
+            return [[] for _ in range(queries.shape[0])]
+        queries = queries[:, active]
+        scores = np.hstack([queries @ self.segments[seg_no].matrix[:, active].T for seg_no in seg_nos])
+        # Column -> global doc id for the chosen segments
+        doc_ids = np.concatenate([
+            np.arange(self.segments[seg_no].n_docs) + self._bases[seg_no] for seg_no in seg_nos
+        ])
+        return [[(float(row[i]), int(doc_ids[i])) for i in top_k_indices(row, n_results)] for row in scores]
+
+    def _search_vector(self, question: str, n_results: int) -> List[Tuple[float, int]]:
+        query = self.encode([question])[0]
+        active = np.flatnonzero(query)
+        if active.size == 0 or not self.segments:
+            return []
+        scores = np.concatenate([active_scores(segment.matrix, query, active) for segment in self.segments])
+        return [(float(scores[i]), i) for i in top_k_indices(scores, n_results)]
+
+    def search(self, question: str, n_results: int = 3) -> List[Tuple[float, Dict]]:
+        """Top `n_results` (score, document) pairs"""
+        if self.backend == "vector":
+            top = self._search_vector(question, n_results)
+        else:
+            top = self._search_keyword(question, n_results)
+        return [(score, self.document(doc_id)) for score, doc_id in top]
+
+    def search_batch(self, questions: List[str], n_results: int = 3) -> List[List[Tuple[float, Dict]]]:
+        """search() for several questions; one matrix product per segment for vectors"""
+        if self.backend != "vector" or not questions:
+            return [self.search(question, n_results) for question in questions]
+        scores = self._vector_scores(self.encode(questions))
+        return [
+            [(float(row[i]), self.document(i)) for i in top_k_indices(row, n_results)]
+            for row in scores
+        ]
+
+    def query(self, question: str, n_results: int = 3) -> str:
+        """Query the indexed RAG system"""
+        try:
+            return format_skills([doc for score, doc in self.search(question, n_results)])
+        except Exception as e:
+            return f"RAG query error: {str(e)}"
+
+
+# ------------------ CLI ------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect an mmap skills index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="ingest documents into an index directory")
+    build.add_argument("source", help=".jsonl/.json/.txt/.md file or a directory of them")
+    build.add_argument("index_dir")
+    build.add_argument("--append", action="store_true", help="add new segments instead of rebuilding")
+    build.add_argument("--dim", type=int, default=None, help=f"vector dimension, 0 for keyword-only (default {VECTOR_DIM})")
+    build.add_argument("--segment-docs", type=int, default=SEGMENT_DOCS)
+    info = commands.add_parser("info", help="print an index manifest")
+    info.add_argument("index_dir")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        manifest = build_index(args.source, args.index_dir, append=args.append,
+                               dim=args.dim, segment_docs=args.segment_docs)
+    else:
+        manifest = _read_manifest(args.index_dir)
+        if manifest is None:
+            print(f"No index at {args.index_dir}", file=sys.stderr)
+            return 1
+    print(json.dumps(manifest, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Sharded retrieval over an mmap skills index, on a pool of worker processes.
+
+    python rag_index.py build cvs/ skills.idx --segment-docs 50000
+    RAG_INDEX_PATH=skills.idx RAG_SHARD_WORKERS=4 python mcp/rag_mcp_stdio.py
+    python bench/bench_shards.py --documents 400000 --workers 1 2 4
+
+The segments of an index (rag_index.py) are its shards. They are grouped
+into one shard per worker, balanced by document count, so an index needs
+at least as many segments as workers (see --segment-docs). Every worker
+maps the whole index read-only at startup, which shares the page cache:
+no document is copied into a worker.
+
+A query is weighted once in the calling process: BM25 IDF comes from the
+document frequencies summed over all term tables, and vector queries are
+encoded with the global IDF. Each shard then scores its own segments and
+returns its local top-k. The caller merges those into the global top-k
+and reads the winning documents from its own mapping. Results match
+MmapRAG exactly.
+"""
+import os
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from local_rag import RAG_SHARD_WORKERS, format_skills
+from rag_index import MmapRAG
+from telemetry import get_logger
+
+logger = get_logger("rag_shards")
+
+
+# ------------------ Worker Side ------------------
+_worker_index: Optional[MmapRAG] = None
+
+def _init_worker(index_dir: str, backend: str):
+    global _worker_index
+    _worker_index = MmapRAG(index_dir, backend=backend)
+
+def _search_shard(seg_nos: List[int], queries, n_results: int) -> List[List[Tuple[float, int]]]:
+    """Local top-k (score, doc_id) per query; `queries` are keyword weights or encoded vectors"""
+    if _worker_index.backend == "vector":
+        return _worker_index.score_vector(queries, n_results, seg_nos)
+    return [_worker_index.score_keyword(weights, n_results, seg_nos) for weights in queries]
+
+
+# ------------------ Sharded Reader ------------------
+def partition(sizes: List[int], n_shards: int) -> List[List[int]]:
+    """Split segment numbers into `n_shards` groups of similar total size (largest first)"""
+    shards: List[Tuple[int, int, List[int]]] = [(0, i, []) for i in range(max(1, n_shards))]
+    for seg_no in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        total, i, members = heapq.heappop(shards)
+        members.append(seg_no)
+        heapq.heappush(shards, (total + sizes[seg_no], i, members))
+    return [sorted(members) for _, _, members in sorted(shards, key=lambda shard: shard[1]) if members]
+
+
+class ShardedRAG:
+    """MmapRAG whose scoring fans out to a process pool, one task per shard"""
+
+    def __init__(self, index_dir: str, backend: str = "keyword", workers: int = RAG_SHARD_WORKERS):
+        self.index = MmapRAG(index_dir, backend=backend)
+        self.backend = backend
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.shards = partition([segment.n_docs for segment in self.index.segments], self.workers)
+        if len(self.shards) < self.workers:
+            logger.warning("Index %s has %d segments for %d shard workers; rebuild with a smaller --segment-docs",
+                           index_dir, len(self.shards), self.workers)
+        # spawn: the MCP servers run an event loop and threads, which don't survive fork
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(index_dir, backend),
+        )
+
+    def has_term(self, term: str) -> bool:
+        return self.index.has_term(term)
+
+    def _encode(self, questions: List[str]):
+        if self.backend == "vector":
+            return self.index.encode(questions)
+        return [self.index.keyword_weights(question) for question in questions]
+
+    def search_batch(self, questions: List[str], n_results: int = 3) -> List[List[Tuple[float, Dict]]]:
+        """Top `n_results` (score, document) pairs per question, one task per shard for the batch"""
+        if not questions or not self.shards:
+            return [[] for _ in questions]
+        queries = self._encode(questions)
+        futures = [self._pool.submit(_search_shard, shard, queries, n_results) for shard in self.shards]
+        per_shard = [future.result() for future in futures]
+        merged = []
+        for q in range(len(questions)):
+            candidates = [hit for shard_hits in per_shard for hit in shard_hits[q]]
+            top = heapq.nlargest(n_results, candidates, key=lambda hit: (hit[0], -hit[1]))
+            merged.append([(score, self.index.document(doc_id)) for score, doc_id in top])
+        return merged
+
+    def search(self, question: str, n_results: int = 3) -> List[Tuple[float, Dict]]:
+        """Top `n_results` (score, document) pairs"""
+        return self.search_batch([question], n_results)[0]
+
+    def query(self, question: str, n_results: int = 3) -> str:
+        """Query the sharded RAG system"""
+        try:
+            return format_skills([doc for score, doc in self.search(question, n_results)])
+        except Exception as e:
+            return f"RAG query error: {str(e)}"
+
+    def warm_up(self):
+        """Start every worker now instead of on the first queries"""
+        list(self._pool.map(_search_shard, [[]] * self.workers, [self._encode([""])] * self.workers,
+                            [1] * self.workers))
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Per-tenant skills indexes, loaded on first use and kept in a bounded LRU.
+
+    tenants/
+        alice/manifest.json, seg-0001-000000.bin   # built with rag_index.py build
+        bob/cv.md                                  # raw CV files, indexed in memory
+    RAG_TENANT_DIR=tenants RAG_TENANT_CACHE_MB=256 python mcp/rag_mcp_stdio.py
+
+A tenant is the id the skills tools receive as conversation_id (a user id
+works the same). Its directory is either an index built by rag_index.py,
+which is memory-mapped, or .jsonl/.json/.txt/.md CV files, which are
+indexed with the RAG_BACKEND in-memory backend. Tenants without a
+directory use the shared index (get_rag_system()).
+
+Resident indexes are kept in LRU order and their sizes (each backend's
+memory_bytes() estimate: postings, vectors and documents for in-memory
+indexes, the mapped segment files for built ones) are capped at
+RAG_TENANT_CACHE_MB. Indexes that
+are being queried are pinned: eviction skips them, so they may push the
+total over the cap until they are released. A tenant is loaded by one
+thread at a time; others asking for it wait for that load. A directory
+whose mtime changed since it was loaded (files replaced, or a
+rag_index.py append) is reloaded.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from local_rag import RAG_BACKEND, create_rag, get_rag_system
+from rag_index import MANIFEST, MmapRAG, iter_documents
+from telemetry import get_logger, span
+
+logger = get_logger("rag_tenants")
+
+RAG_TENANT_DIR = os.getenv("RAG_TENANT_DIR")
+RAG_TENANT_CACHE_MB = float(os.getenv("RAG_TENANT_CACHE_MB", "256"))
+
+# Tenant ids become directory names, so no separators, "..", or hidden files
+TENANT_ID_RE = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}$")
+
+
+class _Resident:
+    def __init__(self, rag, size: int, mtime: int):
+        self.rag = rag
+        self.size = size
+        self.mtime = mtime
+        self.refs = 0
+
+
+class _Load:
+    """Serializes loads of one tenant; dropped once nobody waits on it"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = 0
+
+
+class TenantIndexes:
+    """LRU of per-tenant RAG indexes under a memory cap"""
+
+    def __init__(self, root: str, cache_mb: float = RAG_TENANT_CACHE_MB, backend: str = RAG_BACKEND):
+        self.root = root
+        self.capacity = int(cache_mb * 1024 * 1024)
+        self.backend = backend
+        self._resident: "OrderedDict[str, _Resident]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, _Load] = {}
+        self.resident_bytes = 0
+        self.counters = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0}
+
+    def path(self, tenant: Optional[str]) -> Optional[str]:
+        """The tenant's index directory, or None if it has none"""
+        if not tenant or not TENANT_ID_RE.match(tenant):
+            return None
+        path = os.path.join(self.root, tenant)
+        return path if os.path.isdir(path) else None
+
+    def _load(self, path: str):
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            return MmapRAG(path, backend=self.backend)
+        rag = create_rag(self.backend, list(iter_documents(path)))
+        rag.search("", 1)  # build lazily computed stats before other threads share it
+        return rag
+
+    def _evict(self):
+        """Drop least recently used, unpinned indexes until under the cap (lock held)"""
+        for tenant in list(self._resident):
+            if self.resident_bytes <= self.capacity:
+                break
+            entry = self._resident[tenant]
+            if entry.refs == 0:
+                del self._resident[tenant]
+                self.resident_bytes -= entry.size
+                self.counters["evictions"] += 1
+                logger.debug("Evicted tenant index %s (%d bytes)", tenant, entry.size)
+
+    def _lookup(self, tenant: str, mtime: int) -> Optional[_Resident]:
+        """The resident, current index of `tenant`, pinned (lock held)"""
+        entry = self._resident.get(tenant)
+        if entry is None or entry.mtime != mtime:
+            return None
+        self._resident.move_to_end(tenant)
+        entry.refs += 1
+        return entry
+
+    @contextmanager
+    def acquire(self, tenant: str, path: str):
+        """Pin the tenant's index for the body, loading it if it isn't resident"""
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._lookup(tenant, mtime)
+            if entry is not None:
+                self.counters["hits"] += 1
+            else:
+                loading = self._loading.setdefault(tenant, _Load())
+                loading.waiters += 1
+        if entry is None:
+            try:
+                entry = self._load_pinned(tenant, path, mtime, loading)
+            finally:
+                with self._lock:
+                    loading.waiters -= 1
+                    if loading.waiters == 0:
+                        del self._loading[tenant]
+        try:
+            yield entry.rag
+        finally:
+            with self._lock:
+                entry.refs -= 1
+                self._evict()
+
+    def _load_pinned(self, tenant: str, path: str, mtime: int, loading: _Load) -> _Resident:
+        """Load the tenant's index unless another thread did while we waited, pinned"""
+        with loading.lock:
+            with self._lock:
+                # Another thread may have loaded it while we waited
+                entry = self._lookup(tenant, mtime)
+            if entry is None:
+                with span("rag.tenant_load"):
+                    rag = self._load(path)
+                    size = rag.memory_bytes()
+                with self._lock:
+                    previous = self._resident.pop(tenant, None)
+                    if previous is not None:
+                        self.resident_bytes -= previous.size
+                        self.counters["reloads"] += 1
+                    self.counters["loads"] += 1
+                    entry = _Resident(rag, size, mtime)
+                    entry.refs += 1
+                    self._resident[tenant] = entry
+                    self.resident_bytes += size
+                    self._evict()
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident": len(self._resident),
+                "resident_bytes": self.resident_bytes,
+                "capacity_bytes": self.capacity,
+                **self.counters,
+            }
+
+
+tenant_indexes = TenantIndexes(RAG_TENANT_DIR) if RAG_TENANT_DIR else None
+
+@contextmanager
+def rag_for(tenant: Optional[str]):
+    """(index, own): the tenant's own index if it has one, else the shared index.
+
+    `own` tells callers whether results are the tenant's alone; the skills
+    tools report it so clients only share results of the shared index.
+    """
+    path = tenant_indexes.path(tenant) if tenant_indexes else None
+    if path is None:
+        yield get_rag_system(), False
+        return
+    with tenant_indexes.acquire(tenant, path) as rag:
+        yield rag, True
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Disk-backed cache of web search results for the search MCP servers.
+
+    DDG_CACHE_PATH=search_cache.db DDG_CACHE_TTL=86400 python mcp/search_mcp_stdio.py
+
+Results are kept in one SQLite file (WAL mode), so every search server
+process on the host and every restart shares them. Entries are keyed by
+the normalized query and the number of results. The raw result list is
+stored, not the formatted text.
+
+- Fresher than DDG_CACHE_TTL: served without a search.
+- Older, but within DDG_CACHE_MAX_STALE more: served at once, and one
+  background search per key refreshes the entry (stale-while-revalidate).
+- Older still, or missing: searched now. Concurrent misses for one key
+  share that search. If it fails, any old entry is served instead.
+
+Once the file holds more than DDG_CACHE_MAX_ENTRIES entries or
+DDG_CACHE_MAX_BYTES of results, the least recently read entries are
+evicted. SQLite is only used from worker threads, never on the server's
+event loop.
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telemetry import get_logger, span
+from local_rag import normalize_query
+
+logger = get_logger("search_cache")
+
+PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
+
+DDG_CACHE_PATH = os.getenv("DDG_CACHE_PATH", os.path.join(PROJECT_ROOT, "search_cache.db"))
+# Career resources barely change from day to day; "" or 0 disables the cache
+DDG_CACHE_TTL = float(os.getenv("DDG_CACHE_TTL", str(24 * 3600)) or 0)
+DDG_CACHE_MAX_STALE = float(os.getenv("DDG_CACHE_MAX_STALE", str(7 * 24 * 3600)))
+DDG_CACHE_MAX_ENTRIES = int(os.getenv("DDG_CACHE_MAX_ENTRIES", "20000"))
+DDG_CACHE_MAX_BYTES = int(os.getenv("DDG_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# A hit records its read time only if the stored one is older than this, so
+# most reads don't write to the WAL; LRU order is kept to this granularity
+TOUCH_INTERVAL = 60.0
+
+Results = List[Dict[str, str]]
+
+
+class SearchCache:
+    """Search results in SQLite with TTL, stale-while-revalidate and LRU eviction"""
+
+    def __init__(self, path: str = DDG_CACHE_PATH, ttl: float = DDG_CACHE_TTL,
+                 max_stale: float = DDG_CACHE_MAX_STALE, max_entries: int = DDG_CACHE_MAX_ENTRIES,
+                 max_bytes: int = DDG_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0, "errors_served_stale": 0, "evictions": 0}
+
+    def connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                    fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS results_lru ON results (accessed_at);
+            """)
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[Results, float]]:
+        """(results, age in seconds), however old (blocking)"""
+        with self._lock:
+            conn = self.connection()
+            row = conn.execute("SELECT value, fetched_at, accessed_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[2] > TOUCH_INTERVAL:
+                conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), now - row[1]
+
+    def put(self, key: str, results: Results):
+        """Store `results` and evict over budget (blocking)"""
+        value = json.dumps(results)
+        now = time.time()
+        with self._lock:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, now, now, len(value)),
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop entries too old to serve, then the least recently read over budget (in a transaction)"""
+        evicted = conn.execute("DELETE FROM results WHERE fetched_at < ?", (now - self.ttl - self.max_stale,)).rowcount
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        if (self.max_entries and entries > self.max_entries) or (self.max_bytes and total > self.max_bytes):
+            # Walk from the cold end until both budgets hold
+            drop, cursor = [], conn.execute("SELECT key, size FROM results ORDER BY accessed_at")
+            for key, size in cursor:
+                if not ((self.max_entries and entries > self.max_entries) or (self.max_bytes and total > self.max_bytes)):
+                    break
+                drop.append((key,))
+                entries, total = entries - 1, total - size
+            conn.executemany("DELETE FROM results WHERE key = ?", drop)
+            evicted += len(drop)
+        self.counters["evictions"] += evicted
+
+    def _fetch(self, key: str, fetch: Callable[[], Awaitable[Results]]) -> asyncio.Task:
+        """One search per key at a time; its results are stored when non-empty"""
+        task = self._inflight.get(key)
+        if task is None:
+            async def run():
+                results = await fetch()
+                if results:
+                    await asyncio.to_thread(self.put, key, results)
+                return results
+
+            task = asyncio.create_task(run())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    def _refresh_done(self, key: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background refresh of '%s' failed: %s", key, task.exception())
+
+    async def search(self, query: str, max_results: int, fetch: Callable[[], Awaitable[Results]]) -> Results:
+        """Results for `query`, from the cache when fresh enough, else from fetch()"""
+        if not self.ttl:
+            return await fetch()
+        key = f"{max_results}:{normalize_query(query)}"
+        with span("search.cache") as cache_span:
+            cached = await asyncio.to_thread(self.get, key)
+            if cached is not None and cached[1] < self.ttl:
+                cache_span.outcome = "hit"
+                self.counters["hits"] += 1
+                return cached[0]
+            if cached is not None and cached[1] < self.ttl + self.max_stale:
+                cache_span.outcome = "stale"
+                self.counters["stale"] += 1
+                if key not in self._inflight:
+                    self.counters["refreshes"] += 1
+                    self._fetch(key, fetch).add_done_callback(lambda task: self._refresh_done(key, task))
+                return cached[0]
+            cache_span.outcome = "miss"
+            self.counters["misses"] += 1
+        try:
+            # shield: a caller that gives up doesn't cancel the search others share
+            return await asyncio.shield(self._fetch(key, fetch))
+        except Exception:
+            if cached is None:
+                raise
+            self.counters["errors_served_stale"] += 1
+            logger.warning("Search for '%s' failed; serving results %.0fs old", query, cached[1])
+            return cached[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self.connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        return {"entries": entries, "bytes": total, **self.counters}
@@ -0,0 +1,235 @@
+"""Spans, Prometheus metrics and logging for the agent pipeline.
+
+Every timed step runs inside span(name, **labels). A finished span is
+observed in the `agent_span_duration_seconds` histogram, labelled with its
+name, labels and outcome, and logged at DEBUG as one key=value line.
+render_metrics() returns everything in the Prometheus text format.
+
+The MCP servers are separate processes. They collect their spans with
+collect_spans() and send them back in the tool result's _meta, and the
+client records them with record_spans(). That way RAG scoring and web
+search times end up in the app's /metrics too.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+# Seconds; cache lookups are sub-millisecond, completions take seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_configured = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger writing to stderr at LOG_LEVEL (stdout is the MCP stdio channel).
+
+    Only the app's own loggers follow LOG_LEVEL; libraries stay at WARNING.
+    """
+    global _configured
+    if not _configured:
+        logging.basicConfig(level=logging.WARNING, format=LOG_FORMAT)
+        _configured = True
+    logger = logging.getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+    return logger
+
+
+logger = get_logger("telemetry")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# ------------------ Metrics ------------------
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]!r}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Gauge read from a callback at scrape time: fn() -> [(labels, value), ...]"""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            samples = list(self.fn())
+        except Exception as e:
+            logger.warning("gauge %s failed: %s", self.name, e)
+            samples = []
+        for labels, value in samples:
+            lines.append(f"{self.name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return lines
+
+
+_metrics: Dict[str, object] = {}
+
+
+def counter(name: str, help: str) -> Counter:
+    return _metrics.setdefault(name, Counter(name, help))
+
+
+def histogram(name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+    return _metrics.setdefault(name, Histogram(name, help, buckets))
+
+
+def gauge(name: str, help: str, fn: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> Gauge:
+    _metrics[name] = Gauge(name, help, fn)
+    return _metrics[name]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in list(_metrics.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+SPAN_SECONDS = histogram("agent_span_duration_seconds", "Duration of pipeline spans by span name and outcome")
+SPAN_ERRORS = counter("agent_span_errors_total", "Spans that ended in an error")
+
+
+# ------------------ Spans ------------------
+_collector: ContextVar[Optional[List[dict]]] = ContextVar("span_collector", default=None)
+
+
+class Span:
+    """A timed step. Set `outcome` to report something other than ok/error."""
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self.outcome = "ok"
+        self.duration = 0.0
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "labels": self.labels, "outcome": self.outcome, "duration": self.duration}
+
+
+def _finish(name: str, labels: Dict[str, str], outcome: str, duration: float):
+    SPAN_SECONDS.observe(duration, span=name, outcome=outcome, **labels)
+    if outcome == "error":
+        SPAN_ERRORS.inc(span=name, **labels)
+    if logger.isEnabledFor(logging.DEBUG):
+        fields = " ".join(f"{k}={v}" for k, v in labels.items())
+        logger.debug("span=%s outcome=%s duration_ms=%.2f %s", name, outcome, duration * 1000, fields)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time the body; the outcome is "error" or "cancelled" if it raises"""
+    current = Span(name, labels)
+    started = time.perf_counter()
+    try:
+        yield current
+    except (asyncio.CancelledError, GeneratorExit):
+        current.outcome = "cancelled"
+        raise
+    except BaseException:
+        current.outcome = "error"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _finish(name, labels, current.outcome, current.duration)
+        collected = _collector.get()
+        if collected is not None:
+            collected.append(current.to_dict())
+
+
+@contextmanager
+def collect_spans():
+    """Collect the spans finished in this context, e.g. to return them from a tool call"""
+    collected: List[dict] = []
+    token = _collector.set(collected)
+    try:
+        yield collected
+    finally:
+        _collector.reset(token)
+
+
+def record_spans(spans: Optional[Iterable[dict]]):
+    """Record spans measured in another process (see collect_spans)"""
+    for item in spans or ():
+        try:
+            _finish(item["name"], dict(item.get("labels") or {}), item.get("outcome", "ok"), float(item["duration"]))
+        except (KeyError, TypeError, ValueError):
+            continue